@@ -0,0 +1,182 @@
+"""
+In-process admission control.
+
+Every endpoint class (see `Settings.ADMISSION_LIMITS`) has token buckets per user and per client IP, and a cap on
+the number of its requests in flight in this process. Requests over a limit fail fast with a 429 or 503 and a
+`Retry-After` header, rather than queueing for worker threads and database connections.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, Literal
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.auth import REQUIRE_USER
+from app.config import AdmissionLimit, get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ENDPOINT_CLASS = Literal["agent", "password", "default"]
+
+
+class TokenBucket:
+    """Allow bursts of up to `burst` requests, refilled at `rate` requests per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token, returning 0 on success or the number of seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """Give back a token taken for a request which was rejected anyway."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    """Token buckets per key, keeping at most `max_keys` of the most recently used buckets."""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int):
+        self._rate = rate_per_minute / 60
+        self._burst = burst
+        self._max_keys = max_keys
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self._rate, self._burst)
+                if len(self._buckets) > self._max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take()
+
+    def refund(self, key: str) -> None:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund()
+
+
+class ConcurrencyLimiter:
+    """Non-blocking cap on the number of requests in flight."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+class AdmissionPolicy:
+    def __init__(self, limits: AdmissionLimit, max_keys: int):
+        self.per_user = RateLimiter(limits.user_rate_per_minute, limits.burst, max_keys)
+        self.per_ip = RateLimiter(limits.ip_rate_per_minute, limits.burst, max_keys)
+        self.concurrency = ConcurrencyLimiter(limits.concurrency)
+
+
+policies: dict[str, AdmissionPolicy] = {
+    name: AdmissionPolicy(limits, settings.ADMISSION_MAX_KEYS) for name, limits in settings.ADMISSION_LIMITS.items()
+}
+
+
+def _too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def _enter(request: Request, endpoint_class: str, user_key: str | None) -> ConcurrencyLimiter | None:
+    """Check the limits of an endpoint class, returning the acquired concurrency slot, if any."""
+    if not settings.ADMISSION_ENABLED:
+        return None
+
+    policy = policies[endpoint_class]
+    # The address of the client, rather than of the ingress, as long as the server trusts the ingress' forwarded
+    # headers (uvicorn's --forwarded-allow-ips)
+    client_ip = request.client.host if request.client else "unknown"
+
+    # Users over their limit don't spend their IP's tokens, which may be shared by others behind the same address
+    if user_key is not None and (retry_after := policy.per_user.take(user_key)):
+        logger.debug(f"Rate limited {endpoint_class} request from user {user_key}")
+        raise _too_many_requests(retry_after)
+
+    if retry_after := policy.per_ip.take(client_ip):
+        logger.debug(f"Rate limited {endpoint_class} request from {client_ip}")
+        if user_key is not None:
+            policy.per_user.refund(user_key)
+        raise _too_many_requests(retry_after)
+
+    if not policy.concurrency.try_acquire():
+        logger.warning(f"Rejecting {endpoint_class} request, {policy.concurrency.limit} requests already in flight")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy",
+            headers={"Retry-After": "1"},
+        )
+
+    return policy.concurrency
+
+
+def admit(endpoint_class: ENDPOINT_CLASS):
+    """Dependency enforcing the per-IP and concurrency limits of an endpoint class."""
+
+    async def dependency(request: Request) -> AsyncGenerator[None, None]:
+        slot = _enter(request, endpoint_class, None)
+        try:
+            yield
+        finally:
+            if slot is not None:
+                slot.release()
+
+    return Depends(dependency)
+
+
+def admit_user(endpoint_class: ENDPOINT_CLASS):
+    """Dependency enforcing the per-user, per-IP, and concurrency limits of an endpoint class."""
+
+    async def dependency(request: Request, user: REQUIRE_USER) -> AsyncGenerator[None, None]:
+        slot = _enter(request, endpoint_class, str(user.id))
+        try:
+            yield
+        finally:
+            if slot is not None:
+                slot.release()
+
+    return Depends(dependency)
+
+
+__all__ = ["admit", "admit_user", "policies"]
@@ -5,7 +5,7 @@ from typing import Annotated, Literal, TypeAlias
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy import select
+from sqlalchemy import Select, select
 
 from app import models
 from app.config import get_settings
@@ -68,12 +68,15 @@ def read_token_subject(token: str, expected_type: TOKEN_TYPES) -> str:
     return subject
 
 
+def user_query(email: str) -> Select:
+    return select(models.User).where(models.User.email == email).limit(1)
+
+
 async def _require_user(token: Annotated[str, Depends(oauth2_scheme)], db: DB_SESSION) -> User:
     # Note: this uses non-stateless tokens, however if it is needed for performance reasons, we can encode
     # the desired user attributes directly into the token.
     subject = read_token_subject(token, "access")
-    user_query = select(models.User).where(models.User.email == subject).limit(1)
-    user: models.User | None = db.execute(user_query).scalar_one_or_none()
+    user: models.User | None = db.execute(user_query(subject)).scalar_one_or_none()
     if not user:
         logger.warning(f"Detected valid auth token with no associated user: {subject}")
         raise auth_error()
@@ -112,4 +115,5 @@ __all__ = [
     "REQUIRE_ADMIN_PATH",
     "generate_token",
     "read_token_subject",
+    "user_query",
 ]
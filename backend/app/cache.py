@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Generic, Hashable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+class UserCache(Generic[T]):
+    """
+    Bounded in-process cache holding one value per user.
+
+    Entries are evicted least-recently-used once `max_users` is reached, and expire after `ttl` seconds.
+    Writers are expected to call `invalidate` for every user whose cached value they change, the TTL only
+    bounds staleness for changes made by other processes.
+
+    Like `PageCache`, callers take the `version` before reading the data and pass it along to `set`, so a value
+    read before an invalidation, and stored after it, is discarded.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self._max_users = max_users
+        self._ttl = ttl
+        self._entries: OrderedDict[uuid.UUID, tuple[float, T]] = OrderedDict()
+        # Version of the last invalidation of each user, at most `max_users` of them
+        self._invalidated: OrderedDict[uuid.UUID, int] = OrderedDict()
+        self._version = 0
+        # Version of the last evicted invalidation, or of the last clear
+        self._floor = 0
+        # Sync routes run in a threadpool, so access must be guarded
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, user_id: uuid.UUID) -> T | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+
+            self._entries.move_to_end(user_id)
+            return value
+
+    def set(self, user_id: uuid.UUID, value: T, version: int) -> None:
+        with self._lock:
+            if version < self._invalidated.get(user_id, self._floor):
+                # Already stale
+                return
+            self._entries[user_id] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[uuid.UUID]) -> None:
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                self._invalidated[user_id] = self._version
+                self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self._max_users:
+                _, evicted = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._floor = self._version
+            self._invalidated.clear()
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PageCache:
+    """
+    Bounded in-process cache of rendered pages per user, e.g. their task listing for given pagination parameters.
+
+    `invalidate` stamps users with a new version instead of deleting their pages, and pages rendered at an older
+    version are never served. So a page rendered from data read before an invalidation, and stored after it, is
+    discarded too. Callers take the `version` before reading the data, and pass it along to `set`.
+
+    Pages are evicted least-recently-used once `max_pages` is reached, and expire after `ttl` seconds. At most
+    `max_pages` user versions are kept as well, all pages older than the versions evicted become invalid.
+    """
+
+    def __init__(self, max_pages: int, ttl: float):
+        self._max_pages = max_pages
+        self._ttl = ttl
+        self._pages: OrderedDict[tuple[uuid.UUID, Hashable], tuple[float, int, bytes]] = OrderedDict()
+        self._versions: OrderedDict[uuid.UUID, int] = OrderedDict()
+        self._version = 0
+        # Version of the last evicted user version, or of the last clear
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _valid_from(self, user_id: uuid.UUID) -> int:
+        return self._versions.get(user_id, self._floor)
+
+    def get(self, user_id: uuid.UUID, key: Hashable) -> bytes | None:
+        with self._lock:
+            entry = self._pages.get((user_id, key))
+            if entry is None or entry[0] < time.monotonic() or entry[1] < self._valid_from(user_id):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._pages.move_to_end((user_id, key))
+            return entry[2]
+
+    def set(self, user_id: uuid.UUID, key: Hashable, version: int, page: bytes) -> None:
+        with self._lock:
+            if version < self._valid_from(user_id):
+                # Already stale
+                return
+            self._pages[(user_id, key)] = (time.monotonic() + self._ttl, version, page)
+            self._pages.move_to_end((user_id, key))
+            while len(self._pages) > self._max_pages:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[uuid.UUID]) -> None:
+        with self._lock:
+            self._version += 1
+            for user_id in user_ids:
+                self._versions[user_id] = self._version
+                self._versions.move_to_end(user_id)
+            while len(self._versions) > self._max_pages:
+                _, evicted = self._versions.popitem(last=False)
+                self._floor = max(self._floor, evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._floor = self._version
+            self._versions.clear()
+            self._pages.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "pages": len(self._pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+__all__ = ["PageCache", "UserCache"]
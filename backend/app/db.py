@@ -1,6 +1,7 @@
 from typing import Annotated, Generator, TypeAlias
 
 from fastapi import Depends
+from fastapi.requests import HTTPConnection
 from sqlalchemy import create_engine
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
@@ -16,10 +17,23 @@ class Base(DeclarativeBase):
 
 settings = get_settings()
 engine = create_engine(settings.DATABASE_URL, echo=False, future=True)
+# Serves GET and HEAD requests from the same pool, in `BEGIN READ ONLY` transactions, so a write fails instead of being
+# dropped. Reset when connections are returned to the pool. Statements keep reading committed data as they run, as the
+# caches rely on: their versions are taken after the request's first statement, right before reading.
+read_engine = engine.execution_options(postgresql_readonly=True)
 SessionFactory = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+ReadSessionFactory = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
 
+_READ_METHODS = {"GET", "HEAD"}
+
+
+def _get_session(connection: HTTPConnection) -> Generator[Session, None, None]:
+    if connection.scope.get("method") in _READ_METHODS:
+        # Never committed, closing it only hands its connection back to the pool
+        with ReadSessionFactory() as session:
+            yield session
+        return
 
-def _get_session() -> Generator[Session, None, None]:
     session = SessionFactory()
     try:
         yield session
@@ -45,4 +59,4 @@ def pg_utcnow(_element, _compiler, **_kw):
     return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
 
 
-__all__ = ["Base", "DB_SESSION", "UTCNow", "SessionFactory"]
+__all__ = ["Base", "DB_SESSION", "UTCNow", "SessionFactory", "ReadSessionFactory"]
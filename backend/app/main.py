@@ -1,18 +1,36 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings
-from app.routers import agents, sockets, tasks, users
+from app.notifications import listener
+from app.profiling import ProfilingMiddleware
+from app.reminders import reminders
+from app.routers import admin, agents, sockets, tasks, users
+from app.warmup import warmup
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 logger.parent.setLevel(settings.LOG_LEVEL)
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Runs in the background, so the app can pass liveness checks while warming up
+    background = [asyncio.create_task(warmup.run_until_ready()), asyncio.create_task(listener.run())]
+    if settings.TASK_REMINDER_INTERVAL:
+        background.append(asyncio.create_task(reminders.run()))
+    yield
+    for task in background:
+        task.cancel()
+
+
 app = FastAPI(
     title=settings.APP_NAME,
+    lifespan=lifespan,
     root_path=settings.DEPLOYMENT_PREFIX,
     openapi_url="/openapi.json" if settings.APP_ENV == "development" else None,
 )
@@ -25,11 +43,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.PROFILING_ENABLED:
+    # Left out entirely otherwise, so requests don't pay for it
+    app.add_middleware(ProfilingMiddleware)
 
 app.include_router(users.router, prefix="/users")
 app.include_router(tasks.router, prefix="/tasks")
 app.include_router(agents.router, prefix="/tasks")
 app.include_router(sockets.router, prefix="/ws")
+app.include_router(admin.router, prefix="/admin")
 
 
 @app.get("/health")
@@ -37,6 +59,14 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready(response: Response) -> dict:
+    """Readiness check, only passing once the startup warm-up is complete."""
+    if not warmup.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return warmup.report()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -3,7 +3,7 @@ import enum
 import typing
 import uuid
 
-from sqlalchemy import DateTime, Enum, ForeignKey, Text, Uuid
+from sqlalchemy import DateTime, Enum, ForeignKey, Index, Text, Uuid
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base, UTCNow
@@ -19,17 +19,24 @@ class AgentType(str, enum.Enum):
 
 class AgentResponse(Base):
     __tablename__ = "agent_responses"
+    # Partitioned by month of creation, see app.services.retention for partition management.
+    # response_data is also lz4 compressed in the migrations, which SQLAlchemy can't express.
+    __table_args__ = (
+        Index("ix_agent_responses_task_id_created_at", "task_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     # Response data
-    id: Mapped[uuid.UUID] = mapped_column(Uuid, default=uuid.uuid4, primary_key=True, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, default=uuid.uuid4, primary_key=True)
     agent_type: Mapped[AgentType] = mapped_column(Enum(AgentType), nullable=False)
     response_data: Mapped[str] = mapped_column(Text, nullable=False)
 
     # Metadata
+    # Part of the primary key, as required for the partition key
     created_at: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=UTCNow(),
-        nullable=False,
+        primary_key=True,
     )
 
     # Foreign relations
@@ -3,7 +3,20 @@ import enum
 import typing
 import uuid
 
-from sqlalchemy import DateTime, Enum, ForeignKey, String, Text, Uuid, select
+from sqlalchemy import (
+    ColumnElement,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    Uuid,
+    select,
+    text,
+    union_all,
+)
 from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
 
 from app.db import Base, UTCNow
@@ -34,18 +47,26 @@ class TaskReaders(Base):
         ForeignKey("tasks.id", ondelete="CASCADE"),
         primary_key=True,
     )
+    # Indexed on its own for finding the tasks shared with a user, the primary key only covers lookups by task
     user_id: Mapped[uuid.UUID] = mapped_column(
         Uuid,
         ForeignKey("users.id", ondelete="CASCADE"),
         primary_key=True,
+        index=True,
     )
 
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Serves listing a user's own tasks, newest first
+        Index("ix_tasks_user_id_created_at", "user_id", "created_at"),
+        # Serves scanning open tasks by deadline for reminders, in (deadline, id) order to page through them
+        Index("ix_tasks_deadline_id", "deadline", "id", postgresql_where=text("status <> 'completed'")),
+    )
 
     # Task data
-    id: Mapped[uuid.UUID] = mapped_column(Uuid, default=uuid.uuid4, primary_key=True, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, default=uuid.uuid4, primary_key=True)
     title: Mapped[str] = mapped_column(String(100), nullable=False)
     description: Mapped[str] = mapped_column(Text, nullable=False)
     priority: Mapped[TaskPriority] = mapped_column(Enum(TaskPriority), default=TaskPriority.medium)
@@ -64,6 +85,8 @@ class Task(Base):
         onupdate=UTCNow(),
         nullable=False,
     )
+    # Incremented on every change, so clients can order updates and detect missed ones
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
 
     # Foreign relations
     user_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey("users.id", ondelete="CASCADE"))
@@ -73,13 +96,30 @@ class Task(Base):
         "AgentResponse",
         back_populates="task",
         cascade="all, delete-orphan",
+        # Rely on the foreign key's ON DELETE CASCADE, rather than loading every response to delete it
+        passive_deletes=True,
     )
     readers: Mapped[list["TaskReaders"]] = relationship(passive_deletes=True)
 
-    def get_reader_emails(self, db: Session) -> list[str]:
-        """Return all reader email addresses for this task in a single query."""
+    @classmethod
+    def visible_to(cls, user_id: uuid.UUID) -> ColumnElement[bool]:
+        """
+        Filter for tasks owned by or shared with a user.
+
+        This is a union of two index lookups, as an OR of both conditions can only be served by a sequential scan.
+        """
+        owned = select(cls.id).where(cls.user_id == user_id)
+        shared = select(TaskReaders.task_id).where(TaskReaders.user_id == user_id)
+        return cls.id.in_(union_all(owned, shared))
+
+    def get_readers(self, db: Session) -> list[tuple[uuid.UUID, str]]:
+        """Return the ID and email address of all readers of this task in a single query."""
         # Local import avoids circular imports at module import time.
         from app.models.user import User
 
-        q = select(User.email).join(TaskReaders, TaskReaders.user_id == User.id).where(TaskReaders.task_id == self.id)
-        return list(db.execute(q).scalars().all())
+        q = (
+            select(User.id, User.email)
+            .join(TaskReaders, TaskReaders.user_id == User.id)
+            .where(TaskReaders.task_id == self.id)
+        )
+        return [(user_id, email) for user_id, email in db.execute(q)]
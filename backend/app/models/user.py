@@ -15,7 +15,7 @@ class User(Base):
     __tablename__ = "users"
 
     # User data
-    id: Mapped[uuid.UUID] = mapped_column(Uuid, default=uuid.uuid4, primary_key=True, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, default=uuid.uuid4, primary_key=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     email: Mapped[str] = mapped_column(String(255), nullable=False, unique=True, index=True)
     password_hash: Mapped[str] = mapped_column(String, nullable=False)
@@ -29,4 +29,10 @@ class User(Base):
     )
 
     # Foreign relations
-    tasks: Mapped[list["Task"]] = relationship("Task", back_populates="user")
+    tasks: Mapped[list["Task"]] = relationship(
+        "Task",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        # Tasks are removed by the foreign key's ON DELETE CASCADE, so deleting a user never loads them
+        passive_deletes=True,
+    )
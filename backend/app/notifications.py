@@ -0,0 +1,59 @@
+"""
+Postgres notifications between the app's processes, which each keep their own in-memory state (sockets, caches).
+
+`notify` publishes in the session's transaction, so notifications are only delivered once it commits, to every
+process, including the publishing one. Each process listens on a single connection for all channels with a handler.
+Notifications sent while a listener is reconnecting are lost, so handlers must tolerate missing some.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import psycopg
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db import engine
+
+logger = logging.getLogger(__name__)
+
+# Postgres rejects payloads over 8000 bytes
+MAX_PAYLOAD_SIZE = 8000
+# Ids sent per notification by payloads listing them, leaving room for the rest of the payload. Ids take 40 characters
+# at most, quoted and separated in a JSON list.
+IDS_PER_NOTIFICATION = (MAX_PAYLOAD_SIZE - 200) // 40
+
+
+def notify(db: Session, channel: str, payload: str) -> None:
+    db.execute(select(func.pg_notify(channel, payload)))
+
+
+class Listener:
+    def __init__(self):
+        self._handlers: dict[str, Callable[[str], Awaitable[None]]] = {}
+
+    def handle(self, channel: str, handler: Callable[[str], Awaitable[None]]) -> None:
+        """Register the handler of a channel's payloads, before the listener runs."""
+        self._handlers[channel] = handler
+
+    async def run(self, retry_interval: float = 5) -> None:
+        url = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(url, autocommit=True) as connection:
+                    for channel in self._handlers:
+                        await connection.execute(f"LISTEN {channel}")
+                    async for notification in connection.notifies():
+                        try:
+                            await self._handlers[notification.channel](notification.payload)
+                        except Exception as e:
+                            logger.warning(f"Failed handling a {notification.channel} notification", exc_info=e)
+            except psycopg.Error as e:
+                logger.warning(f"Notification listener disconnected, reconnecting in {retry_interval}s", exc_info=e)
+                await asyncio.sleep(retry_interval)
+
+
+listener = Listener()
+
+__all__ = ["IDS_PER_NOTIFICATION", "MAX_PAYLOAD_SIZE", "Listener", "listener", "notify"]
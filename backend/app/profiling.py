@@ -0,0 +1,344 @@
+"""
+On-demand request profiling, for debugging slow requests in production.
+
+Admins ask for a profile with an `X-Profile: 1` header or a `?profile=1` query parameter, and a fraction of all requests
+(`PROFILING_SAMPLE_RATE`) is profiled as well. Profiled responses carry an `X-Profile-Id` header, to fetch the profile
+from the admin endpoints. Requested profiles which couldn't be taken carry `X-Profile-Skipped` instead. When
+`PROFILING_ENABLED` is off, the middleware and query hooks aren't installed at all, so requests don't pay for them.
+
+Profiles combine stack samples with the SQL statements run for the request, and their timings. Sync endpoints and
+dependencies run in worker threads, whose stacks can't be told apart from those of other requests, so samples cover the
+request's own frames on the event loop and every busy worker thread, and may include concurrent work on a busy process.
+A process profiles one request at a time: requested profiles wait for the one in progress, up to
+`REQUESTED_PROFILE_WAIT` seconds, and sampled ones are skipped while a profile is in progress or requested. Statements
+are attributed exactly, through the request's context, which worker threads inherit.
+
+Profiles are kept as files in `PROFILING_DIR`, the oldest removed past `PROFILING_MAX_PROFILES`, so every process on a
+host can serve them. Other hosts, e.g. the other replicas of a deployment, answer 404 unless `PROFILING_DIR` is a volume
+they all mount: without one, fetch profiles from the pod which served the request, e.g. through `kubectl port-forward`.
+"""
+
+import asyncio
+import contextvars
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from types import FrameType
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Engine, event
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.auth import read_token_subject, user_query
+from app.config import get_settings
+from app.db import ReadSessionFactory
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_SKIPPED_HEADER = "X-Profile-Skipped"
+# Seconds requested profiles wait for the profile in progress, rather than being skipped
+REQUESTED_PROFILE_WAIT = 5
+SAMPLE_INTERVAL = 0.001
+MAX_QUERIES = 1000
+TOP_FUNCTIONS = 50
+
+# Sync endpoints and dependencies run in the threadpool's threads, whose top frame is in these files while they
+# wait for work
+_WORKER_THREAD_NAME = "AnyIO worker thread"
+_IDLE_FILES = tuple(f"{os.sep}{name}" for name in ("threading.py", "queue.py"))
+
+
+@dataclass
+class Query:
+    statement: str
+    duration_ms: float
+    rows: int
+
+
+@dataclass
+class Profile:
+    id: str
+    method: str
+    path: str
+    # Whether an admin asked for the profile, rather than it being sampled
+    requested: bool
+    started_at: str
+    status: int = 0
+    duration_ms: float = 0
+    samples: int = 0
+    queries: list[Query] = field(default_factory=list)
+    queries_dropped: int = 0
+    # Samples by function, and by stack (root first, ";" separated) as expected by flame graph tools
+    functions: list[dict] = field(default_factory=list)
+    stacks: dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "requested": self.requested,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "queries": len(self.queries) + self.queries_dropped,
+            "query_ms": round(sum(query.duration_ms for query in self.queries), 3),
+        }
+
+
+_current: contextvars.ContextVar[Profile | None] = contextvars.ContextVar("profile", default=None)
+
+
+def _before_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, _parameters, _context, _executemany) -> None:
+    profile = _current.get()
+    if profile is None:
+        return
+    duration = time.perf_counter() - conn.info["profiling_started"].pop()
+    if len(profile.queries) >= MAX_QUERIES:
+        profile.queries_dropped += 1
+        return
+    # Parameters are left out, they may hold passwords or personal data
+    profile.queries.append(Query(statement=statement, duration_ms=round(duration * 1000, 3), rows=cursor.rowcount))
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class Sampler(threading.Thread):
+    """
+    Count the stacks of busy worker threads, and of the event loop while it runs a request's frame, until stopped.
+
+    Stacks are counted as tuples of frame labels, root first.
+    """
+
+    def __init__(self, loop_thread: int, request_frame: FrameType, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="Request profiler", daemon=True)
+        self.loop_thread = loop_thread
+        self.request_frame = request_frame
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self._stopped = threading.Event()
+
+    def _include(self, thread_id: int, frame: FrameType, workers: set[int]) -> bool:
+        if thread_id == self.loop_thread:
+            parent: FrameType | None = frame
+            while parent is not None and parent is not self.request_frame:
+                parent = parent.f_back
+            return parent is not None
+        return thread_id in workers and not frame.f_code.co_filename.endswith(_IDLE_FILES)
+
+    def sample(self) -> None:
+        self.samples += 1
+        workers = {thread.ident for thread in threading.enumerate() if thread.name == _WORKER_THREAD_NAME}
+        for thread_id, frame in sys._current_frames().items():
+            if not self._include(thread_id, frame, workers):
+                continue
+            stack = []
+            parent: FrameType | None = frame
+            while parent is not None:
+                stack.append(_frame_label(parent))
+                parent = parent.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def functions(self, limit: int = TOP_FUNCTIONS) -> list[dict]:
+        """The most sampled functions, by samples in the function itself and in its callees."""
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        return [{"function": label, "total": samples, "own": own[label]} for label, samples in total.most_common(limit)]
+
+
+class ProfileStore:
+    """Profiles saved as JSON files in a directory, keeping the most recent `max_profiles`."""
+
+    def __init__(self, directory: Path, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id: uuid.UUID | str) -> Path:
+        return self.directory / f"{uuid.UUID(str(profile_id)).hex}.json"
+
+    def save(self, profile: Profile) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(profile.id)
+        # Written aside then renamed, so other processes never read a partial file
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(asdict(profile)))
+        os.replace(temporary, path)
+        for stale in self._paths()[self.max_profiles :]:
+            stale.unlink(missing_ok=True)
+
+    def _paths(self) -> list[Path]:
+        """Saved profiles, most recent first."""
+        paths = []
+        for path in self.directory.glob("*.json"):
+            try:
+                paths.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                # Removed by another process meanwhile
+                continue
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def get(self, profile_id: uuid.UUID | str) -> Profile | None:
+        try:
+            data = json.loads(self._path(profile_id).read_text())
+        except (FileNotFoundError, ValueError):
+            # Removed meanwhile, or not a profile
+            return None
+        return Profile(**data | {"queries": [Query(**query) for query in data["queries"]]})
+
+    def summaries(self) -> list[dict]:
+        if not self.directory.exists():
+            return []
+        profiles = (self.get(path.stem) for path in self._paths())
+        return [profile.summary() for profile in profiles if profile is not None]
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, sample_rate: float = settings.PROFILING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        # Only used on the event loop
+        self._lock = asyncio.Lock()
+        self._requests_waiting = 0
+        if not event.contains(Engine, "before_cursor_execute", _before_execute):
+            event.listen(Engine, "before_cursor_execute", _before_execute)
+            event.listen(Engine, "after_cursor_execute", _after_execute)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = await self._requested(scope)
+        if not (requested or random.random() < self.sample_rate) or not await self._acquire(requested):
+            await self.app(scope, receive, self._send_skipped(send) if requested else send)
+            return
+
+        profile = Profile(
+            id=uuid.uuid4().hex,
+            method=scope["method"],
+            path=scope["path"],
+            requested=requested,
+            started_at=datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        )
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile.id
+            await send(message)
+
+        sampler = Sampler(threading.get_ident(), sys._getframe())
+        token = _current.set(profile)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            sampler.stop()
+            _current.reset(token)
+            self._lock.release()
+            profile.samples = sampler.samples
+            profile.functions = sampler.functions()
+            profile.stacks = {";".join(stack): count for stack, count in sampler.stacks.most_common()}
+            try:
+                await run_in_threadpool(profiles.save, profile)
+            except OSError as e:
+                logger.warning(f"Failed saving the profile of {profile.method} {profile.path}", exc_info=e)
+
+    @staticmethod
+    def _send_skipped(send: Send) -> Send:
+        async def send_skipped(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[PROFILE_SKIPPED_HEADER] = "busy"
+            await send(message)
+
+        return send_skipped
+
+    async def _acquire(self, requested: bool) -> bool:
+        """Take the process' turn to profile, waiting for the profile in progress if requested."""
+        if not requested:
+            # Sampled profiles give way to requested ones
+            if self._lock.locked() or self._requests_waiting:
+                return False
+            await self._lock.acquire()
+            return True
+        self._requests_waiting += 1
+        try:
+            await asyncio.wait_for(self._lock.acquire(), REQUESTED_PROFILE_WAIT)
+        except TimeoutError:
+            return False
+        finally:
+            self._requests_waiting -= 1
+        return True
+
+    @staticmethod
+    async def _requested(scope: Scope) -> bool:
+        """Whether the request asks to be profiled, and comes from an admin."""
+        headers = Headers(scope=scope)
+        if headers.get(PROFILE_HEADER) != "1" and QueryParams(scope["query_string"]).get("profile") != "1":
+            return False
+        scheme, _, token = headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            return False
+        try:
+            subject = read_token_subject(token, "access")
+        except HTTPException:
+            return False
+
+        def is_admin() -> bool:
+            with ReadSessionFactory() as db:
+                user = db.execute(user_query(subject)).scalar_one_or_none()
+                return user is not None and user.is_admin
+
+        return await run_in_threadpool(is_admin)
+
+
+profiles = ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES)
+
+__all__ = [
+    "PROFILE_HEADER",
+    "PROFILE_ID_HEADER",
+    "PROFILE_SKIPPED_HEADER",
+    "Profile",
+    "ProfileStore",
+    "ProfilingMiddleware",
+    "Sampler",
+    "profiles",
+]
@@ -0,0 +1,218 @@
+"""
+Deadline reminders, pushed to connected users as `task.due` events.
+
+Every `TASK_REMINDER_INTERVAL`, the open tasks whose deadline entered the due soon window, or passed, since the
+previous scan are reminded of to their owner and readers. Only one replica scans: the one holding a session-level
+advisory lock, on a connection it keeps for as long as it leads. When that connection drops, another replica takes
+over from its own last attempt, so a few reminders may be repeated or missed around failovers.
+
+Users may be connected to any replica, so the leader publishes reminders as notifications, and every replica sends
+a single event per batch to each of its connected users.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import uuid
+from collections import defaultdict
+from typing import Iterator, NamedTuple, TypeAlias
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Connection, Select, func, select, text, tuple_
+from sqlalchemy.exc import DBAPIError
+
+from app import models
+from app.config import get_settings
+from app.db import SessionFactory, engine
+from app.notifications import listener, notify
+from app.routers.sockets import manager
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANNEL = "task_due"
+BATCH_SIZE = 500
+# Recipients are split to keep reminders well below the size limit of notifications
+_PAYLOAD_SIZE = 7000
+_MAX_RECIPIENTS = 100
+# Arbitrary advisory lock key, held by the replica scanning for reminders
+_LOCK_KEY = 1_937_006_386
+# Position of a task in (deadline, id) order
+_Key: TypeAlias = tuple[datetime.datetime, uuid.UUID]
+
+
+class Window(NamedTuple):
+    """Deadlines in `(start, end]` are reminded of, as overdue or due soon."""
+
+    start: datetime.datetime
+    end: datetime.datetime
+    overdue: bool
+
+
+def due_tasks_query(window: Window, after: _Key | None = None) -> Select:
+    """A batch of open tasks with a deadline in a window, after the last task of the previous batch."""
+    task = models.Task
+    query = select(task.id, task.title, task.deadline, task.user_id).where(
+        task.status != models.TaskStatus.completed, task.deadline > window.start, task.deadline <= window.end
+    )
+    if after is not None:
+        query = query.where(tuple_(task.deadline, task.id) > tuple_(*after))
+    return query.order_by(task.deadline, task.id).limit(BATCH_SIZE)
+
+
+def payloads(reminders: list[dict]) -> Iterator[str]:
+    """Encode reminders as JSON arrays, each fitting in a notification."""
+    chunk: list[str] = []
+    size = 2
+    for reminder in reminders:
+        # ASCII only, so lengths are byte sizes
+        encoded = json.dumps(reminder, separators=(",", ":"))
+        if chunk and size + len(encoded) + 1 > _PAYLOAD_SIZE:
+            yield f"[{','.join(chunk)}]"
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        yield f"[{','.join(chunk)}]"
+
+
+def by_user(reminders: list[dict]) -> dict[uuid.UUID, list[dict]]:
+    """Group published reminders by recipient."""
+    tasks = defaultdict(list)
+    for reminder in reminders:
+        task = {key: value for key, value in reminder.items() if key != "user_ids"}
+        for user_id in reminder["user_ids"]:
+            tasks[uuid.UUID(user_id)].append(task)
+    return tasks
+
+
+class ReminderScheduler:
+    def __init__(self, interval: datetime.timedelta, due_soon: datetime.timedelta):
+        self.interval = interval
+        self.due_soon = due_soon
+        self._lock_connection: Connection | None = None
+        # End of the last scanned windows, or of the last attempt while not leading
+        self._last_scan: datetime.datetime | None = None
+
+    @property
+    def leader(self) -> bool:
+        return self._lock_connection is not None
+
+    def windows(self, now: datetime.datetime) -> list[Window]:
+        start = self._last_scan or now - self.interval
+        return [Window(start, now, overdue=True), Window(start + self.due_soon, now + self.due_soon, overdue=False)]
+
+    def _release(self) -> None:
+        if self._lock_connection is not None:
+            # Closing the database connection releases the lock, it must not go back to the pool holding it
+            self._lock_connection.invalidate()
+            self._lock_connection.close()
+            self._lock_connection = None
+
+    def _lead(self) -> bool:
+        """Check the lock is still held, or try to acquire it."""
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.execute(text("SELECT 1"))
+                self._lock_connection.commit()
+                return True
+            except DBAPIError:
+                logger.warning("Lost the reminder lock connection")
+                self._release()
+
+        connection = engine.connect()
+        try:
+            acquired = connection.execute(select(func.pg_try_advisory_lock(_LOCK_KEY))).scalar_one()
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        logger.info("Acquired the reminder lock, scanning for due tasks")
+        self._lock_connection = connection
+        return True
+
+    @staticmethod
+    def _publish(window: Window, after: _Key | None) -> tuple[int, _Key | None]:
+        """
+        Publish the reminders for a batch of due tasks, to their owners and readers.
+
+        Returns the number of tasks, and the key of the last one to continue from, unless it was the last batch.
+        """
+        with SessionFactory() as db:
+            tasks = db.execute(due_tasks_query(window, after)).all()
+            if not tasks:
+                return 0, None
+            readers = db.execute(
+                select(models.TaskReaders.task_id, models.TaskReaders.user_id).where(
+                    models.TaskReaders.task_id.in_([task.id for task in tasks])
+                )
+            ).all()
+            recipients = defaultdict(list)
+            for task_id, user_id in readers:
+                recipients[task_id].append(str(user_id))
+
+            reminders = []
+            for task in tasks:
+                reminder = {
+                    "task_id": str(task.id),
+                    "title": task.title,
+                    "deadline": task.deadline.isoformat(),
+                    "overdue": window.overdue,
+                }
+                user_ids = [str(task.user_id), *recipients[task.id]]
+                for start in range(0, len(user_ids), _MAX_RECIPIENTS):
+                    reminders.append(reminder | {"user_ids": user_ids[start : start + _MAX_RECIPIENTS]})
+            for payload in payloads(reminders):
+                notify(db, CHANNEL, payload)
+            # Notifications are only delivered once committed
+            db.commit()
+
+        last = (tasks[-1].deadline, tasks[-1].id) if len(tasks) == BATCH_SIZE else None
+        return len(tasks), last
+
+    def scan(self, now: datetime.datetime) -> int:
+        """Publish the reminders for the windows since the last scan, returning the number of due tasks."""
+        count = 0
+        for window in self.windows(now):
+            after = None
+            while True:
+                published, after = self._publish(window, after)
+                count += published
+                if after is None:
+                    break
+        self._last_scan = now
+        return count
+
+    def tick(self) -> None:
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        if not self._lead():
+            self._last_scan = now
+            return
+        if count := self.scan(now):
+            logger.info(f"Published deadline reminders for {count} tasks")
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    await run_in_threadpool(self.tick)
+                except Exception as e:
+                    logger.warning("Deadline reminder scan failed", exc_info=e)
+                await asyncio.sleep(self.interval.total_seconds())
+        finally:
+            self._release()
+
+
+async def _deliver(payload: str) -> None:
+    """Send the reminders published by the leader to the users connected to this replica."""
+    await manager.send_due_tasks(by_user(json.loads(payload)))
+
+
+reminders = ReminderScheduler(interval=settings.TASK_REMINDER_INTERVAL, due_soon=settings.TASK_DUE_SOON)
+listener.handle(CHANNEL, _deliver)
+
+__all__ = ["CHANNEL", "ReminderScheduler", "Window", "by_user", "due_tasks_query", "payloads", "reminders"]
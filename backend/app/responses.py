@@ -0,0 +1,22 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+
+class SchemaResponse(JSONResponse):
+    """
+    JSON response for schema objects which have already been validated.
+
+    When an endpoint returns a plain model, FastAPI validates it against the response model again, then runs it
+    through the generic `jsonable_encoder` before encoding. Returning this response directly skips both steps,
+    and serializes the content (a model, or a list/dict of models) straight to bytes using pydantic-core.
+
+    Keep `response_model` on the route for documentation, it is not enforced when this response is returned.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+__all__ = ["SchemaResponse"]
@@ -0,0 +1,48 @@
+import uuid
+from dataclasses import asdict
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from app.auth import REQUIRE_ADMIN_PATH
+from app.profiling import Profile, profiles
+from app.routers.sockets import manager
+from app.routers.tasks import task_list_cache
+
+router = APIRouter(tags=["admin"], dependencies=[REQUIRE_ADMIN_PATH])
+
+
+@router.get("/stats/sockets")
+async def socket_stats() -> dict:
+    # Async so it runs on the event loop, which owns the manager's state
+    return manager.stats()
+
+
+@router.get("/stats/caches")
+def cache_stats() -> dict:
+    # Caches are per process, like these counters
+    return {"task_lists": task_list_cache.stats()}
+
+
+@router.get("/profiles")
+def list_profiles() -> list[dict]:
+    """Request profiles saved on this host, most recent first."""
+    return profiles.summaries()
+
+
+def _get_profile(profile_id: uuid.UUID) -> Profile:
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: uuid.UUID) -> dict:
+    return asdict(_get_profile(profile_id))
+
+
+@router.get("/profiles/{profile_id}/stacks", response_class=PlainTextResponse)
+def get_profile_stacks(profile_id: uuid.UUID) -> str:
+    """Sampled stacks in the collapsed format read by flame graph tools, e.g. speedscope or flamegraph.pl."""
+    return "".join(f"{stack} {count}\n" for stack, count in _get_profile(profile_id).stacks.items())
@@ -3,13 +3,14 @@ import uuid
 from fastapi import APIRouter
 
 from app import models
+from app.admission import admit_user
 from app.auth import REQUIRE_USER
 from app.db import DB_SESSION
 from app.routers.tasks import get_task_for_user
 from app.schemas.agents import AgentResponseRead
 from app.services.agents import analyze_task, assist_productivity
 
-router = APIRouter(tags=["agents"])
+router = APIRouter(tags=["agents"], dependencies=[admit_user("agent")])
 
 
 @router.post("/{task_id}/analyze", response_model=AgentResponseRead)
@@ -1,59 +1,502 @@
+import asyncio
+import json
 import logging
+import sys
+import time
 import uuid
+from dataclasses import dataclass, field
+from typing import Collection, Literal, TypeAlias
 
+import msgpack
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from sqlalchemy import select
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
 
 from app import models
 from app.auth import read_token_subject
+from app.config import get_settings
 from app.db import SessionFactory
+from app.notifications import IDS_PER_NOTIFICATION, listener, notify
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(tags=["sockets"])
 
+# Topics clients can subscribe to, in addition to "task:<task id>" for individual tasks
+TOPIC_MINE = "mine"
+TOPIC_SHARED = "shared"
+DEFAULT_TOPICS = (TOPIC_MINE, TOPIC_SHARED)
+
+# Reader changes are published to the other processes, which keep their own topic index
+READERS_CHANNEL = "task_readers"
+# Identifies the notifications of this process, which applied them already
+_ORIGIN = uuid.uuid4().hex
+
+# Events are sent as JSON text frames, or as MessagePack binary frames to clients which ask for them
+Encoding: TypeAlias = Literal["json", "msgpack"]
+
+
+def encode(message: dict, encoding: Encoding) -> str | bytes:
+    if encoding == "json":
+        # Same output as Starlette's send_json
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+    if isinstance(message.get("task"), str):
+        # task.updated events carry the task as a JSON string, MessagePack clients get it as a map instead
+        message = {**message, "task": json.loads(message["task"])}
+    return msgpack.packb(message)
+
+
+@dataclass
+class _Subscription:
+    # Topics requested by the client
+    topics: set[str] = field(default_factory=set)
+    # IDs of the tasks shared with the user, used to resolve the "shared" topic
+    shared_tasks: set[uuid.UUID] = field(default_factory=set)
+    # Index keys this socket is currently registered under
+    keys: set[str] = field(default_factory=set)
+    # Whether the client accepts task.delta events instead of full task.updated events
+    deltas: bool = False
+    encoding: Encoding = "json"
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, max_connections_per_user: int, idle_timeout: float, coalesce_window: float = 0):
+        self.max_connections_per_user = max_connections_per_user
+        self.idle_timeout = idle_timeout
+        self.coalesce_window = coalesce_window
+
         # Map sockets to user IDs and vice-versa for efficient targeted sends
+        # The per-user dicts are used as ordered sets, oldest connection first
         self._ws_to_user: dict[WebSocket, uuid.UUID] = {}
-        self._user_to_ws: dict[uuid.UUID, set[WebSocket]] = {}
+        self._user_to_ws: dict[uuid.UUID, dict[WebSocket, None]] = {}
+        self._last_seen: dict[WebSocket, float] = {}
+
+        # Topic index, mapping "owner:<user id>" and "task:<task id>" keys to the sockets receiving their events,
+        # so broadcasts resolve their recipients without querying the database
+        self._topics: dict[str, dict[WebSocket, None]] = {}
+        self._subscriptions: dict[WebSocket, _Subscription] = {}
+
+        # Tasks which had a frame sent within the coalescing window, and the latest update held back for each
+        self._windows: dict[uuid.UUID, asyncio.Task] = {}
+        self._pending: dict[uuid.UUID, tuple[uuid.UUID, Collection[uuid.UUID], dict, dict | None]] = {}
+
+        self.evicted_total = 0
+        self.reaped_total = 0
+        self.frames_sent = 0
+        self.frames_encoded = 0
+        self.frames_suppressed = 0
+        self.updates_coalesced = 0
 
-    async def register(self, websocket: WebSocket, user_id: uuid.UUID) -> None:
+    async def register(
+        self, websocket: WebSocket, user_id: uuid.UUID, deltas: bool = False, encoding: Encoding = "json"
+    ) -> None:
+        """Register a socket for a user, closing their oldest sockets if they are over the connection limit."""
         self._ws_to_user[websocket] = user_id
-        self._user_to_ws.setdefault(user_id, set()).add(websocket)
+        self._last_seen[websocket] = time.monotonic()
+        self._subscriptions[websocket] = _Subscription(deltas=deltas, encoding=encoding)
+        conns = self._user_to_ws.setdefault(user_id, {})
+        conns[websocket] = None
+
+        while len(conns) > self.max_connections_per_user:
+            oldest = next(iter(conns))
+            logger.debug(f"Evicting oldest WS of {user_id}, over the limit of {self.max_connections_per_user}")
+            self.evicted_total += 1
+            self.disconnect(oldest)
+            await self._close(oldest, reason="Connection limit reached")
 
     def disconnect(self, websocket: WebSocket) -> None:
+        self._last_seen.pop(websocket, None)
+        subscription = self._subscriptions.pop(websocket, None)
+        if subscription is not None:
+            for key in subscription.keys:
+                self._unindex(key, websocket)
+
         user_id = self._ws_to_user.pop(websocket, None)
         if user_id is not None:
             conns = self._user_to_ws.get(user_id)
             if conns and websocket in conns:
-                conns.remove(websocket)
+                del conns[websocket]
                 if not conns:
                     self._user_to_ws.pop(user_id, None)
 
+    def _unindex(self, key: str, websocket: WebSocket) -> None:
+        sockets = self._topics.get(key)
+        if sockets is not None:
+            sockets.pop(websocket, None)
+            if not sockets:
+                del self._topics[key]
+
+    def _reindex(self, websocket: WebSocket) -> None:
+        """Bring the index keys of a socket in line with its subscription."""
+        subscription = self._subscriptions.get(websocket)
+        if subscription is None:
+            return
+
+        keys = {topic for topic in subscription.topics if topic.startswith("task:")}
+        if TOPIC_MINE in subscription.topics:
+            keys.add(f"owner:{self._ws_to_user[websocket]}")
+        if TOPIC_SHARED in subscription.topics:
+            keys.update(f"task:{task_id}" for task_id in subscription.shared_tasks)
+
+        for key in subscription.keys - keys:
+            self._unindex(key, websocket)
+        for key in keys - subscription.keys:
+            self._topics.setdefault(key, {})[websocket] = None
+        subscription.keys = keys
+
+    def subscribe(self, websocket: WebSocket, topics: set[str], shared_tasks: set[uuid.UUID] | None = None) -> None:
+        """
+        Subscribe a socket to topics.
+
+        Topics must already be validated, and `shared_tasks` must be provided when subscribing to "shared".
+        """
+        subscription = self._subscriptions.get(websocket)
+        if subscription is None:
+            return
+        subscription.topics |= topics
+        if shared_tasks is not None:
+            subscription.shared_tasks = shared_tasks
+        self._reindex(websocket)
+
+    def unsubscribe(self, websocket: WebSocket, topics: set[str]) -> None:
+        subscription = self._subscriptions.get(websocket)
+        if subscription is None:
+            return
+        subscription.topics -= topics
+        self._reindex(websocket)
+
+    def topics(self, websocket: WebSocket) -> set[str]:
+        subscription = self._subscriptions.get(websocket)
+        return set(subscription.topics) if subscription else set()
+
+    def add_reader(self, task_id: uuid.UUID, user_id: uuid.UUID) -> None:
+        """Start sending events of a newly shared task to the reader's sockets subscribed to "shared"."""
+        for ws in self._user_to_ws.get(user_id, {}):
+            self._subscriptions[ws].shared_tasks.add(task_id)
+            self._reindex(ws)
+
+    def remove_reader(self, task_id: uuid.UUID, user_id: uuid.UUID) -> None:
+        """Stop sending events of a task to a reader who lost access to it."""
+        for ws in self._user_to_ws.get(user_id, {}):
+            subscription = self._subscriptions[ws]
+            subscription.shared_tasks.discard(task_id)
+            subscription.topics.discard(f"task:{task_id}")
+            self._reindex(ws)
+
+    def _remove_task(self, task_id: uuid.UUID) -> None:
+        key = f"task:{task_id}"
+        for ws in list(self._topics.get(key, {})):
+            subscription = self._subscriptions[ws]
+            subscription.shared_tasks.discard(task_id)
+            subscription.topics.discard(key)
+            self._reindex(ws)
+
+    def touch(self, websocket: WebSocket) -> None:
+        """Record activity from a client."""
+        if websocket in self._last_seen:
+            self._last_seen[websocket] = time.monotonic()
+
+    def is_idle(self, websocket: WebSocket) -> bool:
+        last_seen = self._last_seen.get(websocket)
+        return last_seen is None or time.monotonic() - last_seen > self.idle_timeout
+
+    async def reap(self, websocket: WebSocket) -> None:
+        """Drop and close a socket which stopped responding."""
+        self.reaped_total += 1
+        self.disconnect(websocket)
+        await self._close(websocket, reason="Idle timeout")
+
+    @staticmethod
+    async def _close(websocket: WebSocket, reason: str) -> None:
+        try:
+            await websocket.close(code=1008, reason=reason)
+        except Exception as e:
+            # The socket may already be closed, or the connection dead
+            logger.debug("Error while closing WS", exc_info=e)
+
+    def _task_recipients(
+        self, task_id: uuid.UUID, owner_id: uuid.UUID, reader_ids: Collection[uuid.UUID]
+    ) -> set[WebSocket]:
+        """
+        Sockets subscribed to a task, or its owner's tasks.
+
+        Readers removed by another process may still be indexed until its notification arrives, or for good if it
+        is missed, so the sockets subscribed to the task are checked against its current readers.
+        """
+        recipients = {
+            ws
+            for ws in self._topics.get(f"task:{task_id}", ())
+            if (user_id := self._ws_to_user.get(ws)) == owner_id or user_id in reader_ids
+        }
+        recipients.update(self._topics.get(f"owner:{owner_id}", ()))
+        return recipients
+
+    @staticmethod
+    async def _send_frame(websocket: WebSocket, frame: str | bytes) -> None:
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+    async def send(self, websocket: WebSocket, message: dict) -> None:
+        """Send a message to a single socket, in its encoding."""
+        subscription = self._subscriptions.get(websocket)
+        await self._send_frame(websocket, encode(message, subscription.encoding if subscription else "json"))
+
+    async def _send(self, sockets: set[WebSocket], message: dict, delta: dict | None = None) -> None:
+        """
+        Send a message to sockets, or its delta form to the sockets which accept deltas.
+
+        Each form is encoded once per encoding in use, rather than once per socket. Compression, when negotiated,
+        still happens per socket, as each connection has its own compression context.
+        """
+        logger.debug(f"Sending WS {message['event']} to {len(sockets)} sockets")
+        frames: dict[tuple[bool, Encoding], str | bytes] = {}
+        for ws in sockets:
+            subscription = self._subscriptions.get(ws)
+            use_delta = delta is not None and subscription is not None and subscription.deltas
+            form = (use_delta, subscription.encoding if subscription else "json")
+            frame = frames.get(form)
+            if frame is None:
+                frame = frames[form] = encode(delta if use_delta else message, form[1])
+                self.frames_encoded += 1
+            try:
+                await self._send_frame(ws, frame)
+                self.frames_sent += 1
+            except Exception as e:
+                # On any failure, drop the socket
+                logger.debug("Error while sending WS message", exc_info=e)
+                self.disconnect(ws)
+
     async def _send_to_users(self, user_ids: set[uuid.UUID], message: dict) -> None:
+        sockets = set()
         for user_id in user_ids:
-            for ws in list(self._user_to_ws.get(user_id, set())):
-                logger.debug(f"Sending WS {message['event']} to {user_id}")
-                try:
-                    await ws.send_json(message)
-                except Exception as e:
-                    # On any failure, drop the socket
-                    logger.debug("Error while sending WS message", exc_info=e)
-                    self.disconnect(ws)
-
-    async def send_task_update(self, user_ids: set[uuid.UUID], task_payload: dict) -> None:
-        """Send a task update event with payload to a set of user IDs."""
+            sockets.update(self._user_to_ws.get(user_id, {}))
+        await self._send(sockets, message)
+
+    async def send_task_update(
+        self,
+        task_id: uuid.UUID,
+        owner_id: uuid.UUID,
+        reader_ids: Collection[uuid.UUID],
+        task_payload: str,
+        delta: dict | None = None,
+    ) -> None:
+        """
+        Send a task update event to every socket subscribed to the task, or its owner's tasks.
+
+        Only the owner and the current readers of the task (`reader_ids`) receive it.
+
+        If `delta` is given (with `base_version`, `version`, and the changed fields in `changes`), sockets which
+        accept deltas receive a compact task.delta event instead of the full task.
+
+        With a coalescing window, the first update of a task is sent right away, and later updates within the
+        window are held back, so only the latest state of the task is sent once the window closes.
+        Held back deltas are merged, so the delta sent spans every update made within the window.
+        """
         message = {"event": "task.updated", "task": task_payload}
-        await self._send_to_users(user_ids, message)
+        if delta is not None:
+            delta = {"event": "task.delta", "task_id": str(task_id), **delta}
+
+        if self.coalesce_window <= 0:
+            await self._send(self._task_recipients(task_id, owner_id, reader_ids), message, delta)
+            return
+
+        if task_id in self._windows:
+            if task_id in self._pending:
+                # The held back update is superseded, and will never be sent
+                self.updates_coalesced += 1
+                self.frames_suppressed += len(self._task_recipients(task_id, owner_id, reader_ids))
+                delta = _merge_deltas(self._pending[task_id][3], delta)
+            self._pending[task_id] = (owner_id, reader_ids, message, delta)
+            return
 
-    async def send_task_deletion(self, user_ids: set[uuid.UUID], task_id: uuid.UUID) -> None:
+        await self._send(self._task_recipients(task_id, owner_id, reader_ids), message, delta)
+        self._windows[task_id] = asyncio.create_task(self._close_window(task_id))
+
+    async def _close_window(self, task_id: uuid.UUID) -> None:
+        await asyncio.sleep(self.coalesce_window)
+        pending = self._pending.pop(task_id, None)
+        if pending is None:
+            self._windows.pop(task_id, None)
+            return
+
+        owner_id, reader_ids, message, delta = pending
+        await self._send(self._task_recipients(task_id, owner_id, reader_ids), message, delta)
+        # The task is still being edited, so keep coalescing for another window
+        self._windows[task_id] = asyncio.create_task(self._close_window(task_id))
+
+    def _cancel_window(self, task_id: uuid.UUID) -> None:
+        self._pending.pop(task_id, None)
+        window = self._windows.pop(task_id, None)
+        if window is not None:
+            window.cancel()
+
+    async def send_task_deletion(
+        self, task_id: uuid.UUID, owner_id: uuid.UUID, reader_ids: Collection[uuid.UUID]
+    ) -> None:
+        """Send a task deletion event to every socket subscribed to the task, or its owner's tasks."""
+        # Pending updates of a deleted task are pointless
+        self._cancel_window(task_id)
+        message = {"event": "task.deleted", "task_id": str(task_id)}
+        await self._send(self._task_recipients(task_id, owner_id, reader_ids), message)
+        self._remove_task(task_id)
+
+    async def send_task_removal(self, user_ids: set[uuid.UUID], task_id: uuid.UUID) -> None:
+        """Tell users a task is gone from their dashboard, e.g. because they lost access to it."""
         message = {"event": "task.deleted", "task_id": str(task_id)}
         await self._send_to_users(user_ids, message)
 
+    async def send_due_tasks(self, reminders: dict[uuid.UUID, list[dict]]) -> None:
+        """Send each user a single `task.due` event, listing their tasks which are due soon or overdue."""
+        for user_id, tasks in reminders.items():
+            if user_id in self._user_to_ws:
+                await self._send_to_users({user_id}, {"event": "task.due", "tasks": tasks})
+
+    async def send_import_progress(self, user_id: uuid.UUID, imported: int, done: bool) -> None:
+        """Report the progress of a task import to the importing user, whose dashboard should reload once done."""
+        message = {"event": "tasks.import", "imported": imported, "done": done}
+        await self._send_to_users({user_id}, message)
+
+    def stats(self) -> dict:
+        """Connection gauges, including the approximate memory held by the manager's own bookkeeping."""
+        maps = (self._ws_to_user, self._user_to_ws, self._last_seen, self._topics, self._subscriptions)
+        memory = sum(sys.getsizeof(d) for d in maps)
+        memory += sum(sys.getsizeof(conns) for conns in self._user_to_ws.values())
+        memory += sum(sys.getsizeof(sockets) for sockets in self._topics.values())
+        memory += sum(
+            sys.getsizeof(s.topics) + sys.getsizeof(s.shared_tasks) + sys.getsizeof(s.keys)
+            for s in self._subscriptions.values()
+        )
+        return {
+            "connections": len(self._ws_to_user),
+            "users": len(self._user_to_ws),
+            "topics": len(self._topics),
+            "evicted_total": self.evicted_total,
+            "reaped_total": self.reaped_total,
+            "frames_sent": self.frames_sent,
+            "frames_encoded": self.frames_encoded,
+            "frames_suppressed": self.frames_suppressed,
+            "updates_coalesced": self.updates_coalesced,
+            "coalescing_tasks": len(self._windows),
+            "memory_bytes": memory,
+        }
+
+
+def _merge_deltas(older: dict | None, newer: dict | None) -> dict | None:
+    """Combine two consecutive deltas of a task, or return None if either update has no delta."""
+    if older is None or newer is None:
+        return None
+    return {**newer, "base_version": older["base_version"], "changes": {**older["changes"], **newer["changes"]}}
+
+
+manager = ConnectionManager(
+    max_connections_per_user=settings.WS_MAX_CONNECTIONS_PER_USER,
+    idle_timeout=settings.WS_IDLE_TIMEOUT.total_seconds(),
+    coalesce_window=settings.WS_COALESCE_WINDOW.total_seconds(),
+)
+
+
+def publish_reader_changes(db: Session, task_id: uuid.UUID, added: set[uuid.UUID], removed: set[uuid.UUID]) -> None:
+    """Have the other processes apply reader changes, already applied by this one, once the session commits."""
+    for change, user_ids in (("added", added), ("removed", removed)):
+        encoded = [str(user_id) for user_id in user_ids]
+        for start in range(0, len(encoded), IDS_PER_NOTIFICATION):
+            payload = {
+                "origin": _ORIGIN,
+                "task_id": str(task_id),
+                change: encoded[start : start + IDS_PER_NOTIFICATION],
+            }
+            notify(db, READERS_CHANNEL, json.dumps(payload))
+
+
+async def _apply_reader_changes(payload: str) -> None:
+    change = json.loads(payload)
+    if change["origin"] == _ORIGIN:
+        return
+    task_id = uuid.UUID(change["task_id"])
+    for user_id in change.get("added", ()):
+        manager.add_reader(task_id, uuid.UUID(user_id))
+    removed = {uuid.UUID(user_id) for user_id in change.get("removed", ())}
+    for user_id in removed:
+        manager.remove_reader(task_id, user_id)
+    if removed:
+        await manager.send_task_removal(removed, task_id)
+
+
+listener.handle(READERS_CHANNEL, _apply_reader_changes)
+
+
+def _resolve_topics(user_id: uuid.UUID, topics: set[str]) -> tuple[set[str], set[uuid.UUID] | None]:
+    """
+    Validate requested topics, returning the allowed ones and the tasks shared with the user (if requested).
 
-manager = ConnectionManager()
+    Unknown topics, and tasks the user can't read, are dropped.
+    """
+    allowed = topics & {TOPIC_MINE, TOPIC_SHARED}
+    task_ids = set()
+    for topic in topics - allowed:
+        if topic.startswith("task:"):
+            try:
+                task_ids.add(uuid.UUID(topic.removeprefix("task:")))
+            except ValueError:
+                pass
+
+    shared_tasks = None
+    if TOPIC_SHARED not in topics and not task_ids:
+        return allowed, shared_tasks
+
+    with SessionFactory() as db:
+        if TOPIC_SHARED in topics:
+            shared_query = select(models.TaskReaders.task_id).where(models.TaskReaders.user_id == user_id)
+            shared_tasks = set(db.execute(shared_query).scalars())
+
+        if task_ids:
+            readable_query = select(models.Task.id).where(
+                models.Task.id.in_(task_ids),
+                or_(
+                    models.Task.user_id == user_id,
+                    models.Task.readers.any(models.TaskReaders.user_id == user_id),
+                ),
+            )
+            allowed.update(f"task:{task_id}" for task_id in db.execute(readable_query).scalars())
+
+    return allowed, shared_tasks
+
+
+def _find_user(email: str) -> models.User | None:
+    with SessionFactory() as db:
+        return db.execute(select(models.User).where(models.User.email == email).limit(1)).scalar_one_or_none()
+
+
+async def _handle_message(websocket: WebSocket, user_id: uuid.UUID, raw: str) -> None:
+    """
+    Handle a client message.
+
+    Clients may (un)subscribe with `{"action": "subscribe" | "unsubscribe", "topics": [...]}`, where topics are
+    "mine", "shared", or "task:<task id>". Anything else, such as pongs, only counts as a sign of life.
+    """
+    try:
+        message = json.loads(raw)
+        action = message.get("action")
+        topics = message.get("topics", [])
+    except (ValueError, AttributeError):
+        return
+
+    if action not in ("subscribe", "unsubscribe"):
+        return
+    if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+        await manager.send(websocket, {"event": "error", "detail": "topics must be a list of strings"})
+        return
+
+    if action == "subscribe":
+        allowed, shared_tasks = await run_in_threadpool(_resolve_topics, user_id, set(topics))
+        manager.subscribe(websocket, allowed, shared_tasks)
+    else:
+        manager.unsubscribe(websocket, set(topics))
+    await manager.send(websocket, {"event": "subscribed", "topics": sorted(manager.topics(websocket))})
 
 
 @router.websocket("/tasks")
@@ -72,18 +515,43 @@ async def watch_tasks(websocket: WebSocket):
         return
 
     # Resolve user from subject
-    with SessionFactory() as db:
-        user = db.execute(select(models.User).where(models.User.email == subject).limit(1)).scalar_one_or_none()
+    user = await run_in_threadpool(_find_user, subject)
 
     if user is None:
         await websocket.close(code=1008)
         return
 
+    # Initial topics can be selected with ?topics=mine,task:<id>, defaulting to "mine" and "shared"
+    requested = websocket.query_params.get("topics")
+    topics = set(requested.split(",")) if requested is not None else set(DEFAULT_TOPICS)
+    # Clients opt into task.delta events with ?deltas=true
+    deltas = websocket.query_params.get("deltas", "").lower() in ("1", "true")
+    # and into MessagePack binary frames with ?encoding=msgpack, their own messages are still JSON text.
+    # Compression (permessage-deflate) is negotiated by the server during the handshake, for either encoding.
+    encoding: Encoding = "msgpack" if websocket.query_params.get("encoding") == "msgpack" else "json"
+
     await websocket.accept()
-    await manager.register(websocket, user.id)
+    await manager.register(websocket, user.id, deltas, encoding)
+    allowed, shared_tasks = await run_in_threadpool(_resolve_topics, user.id, topics)
+    manager.subscribe(websocket, allowed, shared_tasks)
+
+    ping_interval = settings.WS_PING_INTERVAL.total_seconds()
     try:
-        # Keep the connection alive, but ignore incoming messages
         while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), timeout=ping_interval)
+            except asyncio.TimeoutError:
+                if manager.is_idle(websocket):
+                    logger.debug(f"Reaping idle WS of {user.id}")
+                    await manager.reap(websocket)
+                    return
+                await manager.send(websocket, {"event": "ping"})
+            else:
+                # Any message, including the pong answering a ping, is a sign of life
+                manager.touch(websocket)
+                await _handle_message(websocket, user.id, raw)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError is raised when receiving on a socket the server already closed, e.g. an evicted one
+        pass
+    finally:
         manager.disconnect(websocket)
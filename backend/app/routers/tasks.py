@@ -1,16 +1,84 @@
+import datetime
+import logging
+import time
 import uuid
+from typing import AsyncIterator, Iterable
 
-from fastapi import APIRouter, HTTPException, Query
-from sqlalchemy import delete, or_, select
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, and_, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from app import models
+from app.admission import admit_user
 from app.auth import REQUIRE_USER
+from app.cache import PageCache, UserCache
+from app.config import get_settings
 from app.db import DB_SESSION
-from app.routers.sockets import manager
-from app.schemas.tasks import TaskCreate, TaskRead, TaskSummary, TaskUpdate
+from app.notifications import IDS_PER_NOTIFICATION, listener, notify
+from app.responses import SchemaResponse
+from app.routers.sockets import manager, publish_reader_changes
+from app.schemas.agents import AgentResponseRead
+from app.schemas.tasks import (
+    TaskCreate,
+    TaskImportError,
+    TaskImportResult,
+    TaskRead,
+    TaskReadersUpdate,
+    TaskStats,
+    TaskSummary,
+    TaskUpdate,
+)
+from app.services import transfer
+
+router = APIRouter(tags=["tasks"], dependencies=[admit_user("default")])
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Invalid records past this are only counted
+IMPORT_MAX_ERRORS = 100
+
+task_stats_cache: UserCache[TaskStats] = UserCache(
+    max_users=settings.TASK_STATS_CACHE_SIZE,
+    ttl=settings.TASK_STATS_CACHE_TTL.total_seconds(),
+)
+# Rendered task listings, by user and pagination
+task_list_cache = PageCache(
+    max_pages=settings.TASK_LIST_CACHE_SIZE,
+    ttl=settings.TASK_LIST_CACHE_TTL.total_seconds(),
+)
+
+TASK_CACHES_CHANNEL = "task_caches"
+
+
+def _invalidate_caches(user_ids: set[uuid.UUID]) -> None:
+    task_stats_cache.invalidate(user_ids)
+    task_list_cache.invalidate(user_ids)
+
+
+def invalidate_task_caches(db: Session, user_ids: Iterable[uuid.UUID]) -> None:
+    """
+    Invalidate the cached task listings and stats of users whose visible tasks change in the session's transaction.
+
+    Caches are invalidated in this process right away, and in every process once the transaction commits, which
+    also discards the pages rendered in between from data read before the commit.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    _invalidate_caches(user_ids)
+    encoded = [str(user_id) for user_id in user_ids]
+    for start in range(0, len(encoded), IDS_PER_NOTIFICATION):
+        notify(db, TASK_CACHES_CHANNEL, ",".join(encoded[start : start + IDS_PER_NOTIFICATION]))
+
 
-router = APIRouter(tags=["tasks"])
+async def _invalidate_notified(payload: str) -> None:
+    _invalidate_caches({uuid.UUID(user_id) for user_id in payload.split(",")})
+
+
+listener.handle(TASK_CACHES_CHANNEL, _invalidate_notified)
 
 
 @router.post("/", response_model=TaskRead, status_code=201)
@@ -26,33 +94,148 @@ def create_task(payload: TaskCreate, db: DB_SESSION, user: REQUIRE_USER) -> Task
     db.add(task)
     db.flush()
     db.refresh(task)
+    invalidate_task_caches(db, {user.id})
     return TaskRead.from_db(db, task)
 
 
+def list_tasks_query(user_id: uuid.UUID, skip: int, limit: int) -> Select:
+    return (
+        select(models.Task)
+        .where(models.Task.visible_to(user_id))
+        .order_by(models.Task.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+
+
 @router.get("/", response_model=list[TaskSummary])
 def list_tasks(
     db: DB_SESSION,
     user: REQUIRE_USER,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-) -> list[TaskSummary]:
-    query = (
-        select(models.Task)
-        .where(
-            or_(
-                models.Task.user_id == user.id,
-                models.Task.readers.any(models.TaskReaders.user_id == user.id),
-            )
-        )
-        .order_by(models.Task.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-    )
+) -> Response:
+    page = task_list_cache.get(user.id, (skip, limit))
+    if page is not None:
+        return Response(page, media_type="application/json")
+
+    # Taken before reading, so the page is discarded if the tasks change meanwhile
+    version = task_list_cache.version
     read = []
-    for task in db.execute(query).scalars():
+    for task in db.execute(list_tasks_query(user.id, skip, limit)).scalars():
         read.append(TaskSummary.from_db(task))
 
-    return read
+    response = SchemaResponse(read)
+    task_list_cache.set(user.id, (skip, limit), version, response.body)
+    return response
+
+
+def task_stats_query(user_id: uuid.UUID, now: datetime.datetime) -> Select:
+    incomplete = models.Task.status != models.TaskStatus.completed
+    return (
+        select(
+            models.Task.status,
+            models.Task.priority,
+            func.count(),
+            func.count().filter(and_(incomplete, models.Task.deadline < now)),
+            func.count().filter(
+                and_(incomplete, models.Task.deadline >= now, models.Task.deadline < now + settings.TASK_DUE_SOON)
+            ),
+        )
+        .where(models.Task.visible_to(user_id))
+        .group_by(models.Task.status, models.Task.priority)
+    )
+
+
+@router.get("/stats", response_model=TaskStats)
+def get_task_stats(db: DB_SESSION, user: REQUIRE_USER) -> SchemaResponse:
+    """Count tasks visible to the user by status and priority, including overdue and due soon tasks."""
+    stats = task_stats_cache.get(user.id)
+    if stats is not None:
+        return SchemaResponse(stats)
+
+    # Taken before reading, so the stats are discarded if the tasks change meanwhile
+    version = task_stats_cache.version
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    stats = TaskStats()
+    for status, priority, count, overdue, due_soon in db.execute(task_stats_query(user.id, now)):
+        stats.total += count
+        stats.by_status[status] += count
+        stats.by_priority[priority] += count
+        stats.overdue += overdue
+        stats.due_soon += due_soon
+
+    task_stats_cache.set(user.id, stats, version)
+    return SchemaResponse(stats)
+
+
+@router.get("/export")
+def export_tasks(user: REQUIRE_USER, format: transfer.TransferFormat = "ndjson") -> StreamingResponse:
+    """Stream all tasks owned by the user, as NDJSON or CSV."""
+    return StreamingResponse(
+        transfer.export_tasks(user.id, format),
+        media_type=transfer.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="tasks.{format}"'},
+    )
+
+
+@router.post("/import", response_model=TaskImportResult)
+async def import_tasks(
+    request: Request, db: DB_SESSION, user: REQUIRE_USER, format: transfer.TransferFormat = "ndjson"
+) -> TaskImportResult:
+    """
+    Create tasks from an NDJSON or CSV upload, in the same format as exports.
+
+    The upload is parsed as it is received and loaded in batches, reporting progress over the user's websockets.
+    Invalid records are skipped and listed in the result, valid ones are committed together at the end.
+    """
+    start = time.perf_counter()
+    parser = transfer.ImportParser(format, max_bytes=settings.TASK_IMPORT_MAX_BYTES)
+    result = TaskImportResult()
+
+    async def records() -> AsyncIterator[tuple[int, TaskCreate | str]]:
+        try:
+            async for chunk in request.stream():
+                for record in parser.feed(chunk):
+                    yield record
+        except transfer.ImportTooLarge as e:
+            raise HTTPException(413, str(e))
+        for record in parser.close():
+            yield record
+
+    async def load(batch: list[TaskCreate]) -> None:
+        await run_in_threadpool(transfer.copy_tasks, db, user.id, batch)
+        result.imported += len(batch)
+        logger.info(f"Imported {result.imported} tasks for user {user.id}")
+        await manager.send_import_progress(user.id, result.imported, done=False)
+
+    batch: list[TaskCreate] = []
+    async for line, task in records():
+        if isinstance(task, str):
+            result.failed += 1
+            if len(result.errors) < IMPORT_MAX_ERRORS:
+                result.errors.append(TaskImportError(line=line, detail=task))
+            continue
+        if result.imported + len(batch) >= settings.TASK_IMPORT_MAX_ROWS:
+            raise HTTPException(413, f"Imports are limited to {settings.TASK_IMPORT_MAX_ROWS} tasks")
+        batch.append(task)
+        if len(batch) == transfer.BATCH_SIZE:
+            await load(batch)
+            batch = []
+    if batch:
+        await load(batch)
+
+    # Committed before telling the user's dashboards to reload
+    invalidate_task_caches(db, {user.id})
+    await run_in_threadpool(db.commit)
+    await manager.send_import_progress(user.id, result.imported, done=True)
+    result.duration_ms = round((time.perf_counter() - start) * 1000, 2)
+    logger.info(f"Import for user {user.id} complete: {result.imported} tasks, {result.failed} invalid")
+    return result
+
+
+def task_query(task_id: uuid.UUID) -> Select:
+    return select(models.Task).where(models.Task.id == task_id).limit(1)
 
 
 def get_task_for_user(
@@ -61,8 +244,7 @@ def get_task_for_user(
     user_id: uuid.UUID,
     allow_readers: bool = False,
 ) -> models.Task | None:
-    query = select(models.Task).where(models.Task.id == task_id).limit(1)
-    task: models.Task | None = db.execute(query).scalar_one_or_none()
+    task: models.Task | None = db.execute(task_query(task_id)).scalar_one_or_none()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     elif task.user_id != user_id and not (allow_readers and any(user_id == r.user_id for r in task.readers)):
@@ -70,111 +252,217 @@ def get_task_for_user(
     return task
 
 
+def _parse_if_match(value: str) -> int | None:
+    """Return the task version required by an If-Match header, or None if any version matches."""
+    value = value.strip()
+    if value == "*":
+        return None
+    try:
+        return int(value.removeprefix("W/").strip('"'))
+    except ValueError:
+        # Nothing can match a malformed entity tag
+        raise HTTPException(status_code=412, detail="Task was modified")
+
+
+def _etag(version: int) -> dict[str, str]:
+    return {"ETag": f'"{version}"'}
+
+
 @router.get("/{task_id}", response_model=TaskRead)
-def get_task(task_id: uuid.UUID, db: DB_SESSION, user: REQUIRE_USER) -> TaskRead:
+def get_task(task_id: uuid.UUID, db: DB_SESSION, user: REQUIRE_USER) -> SchemaResponse:
     task = get_task_for_user(db, task_id, user.id, allow_readers=True)
-    return TaskRead.from_db(db, task)
+    read = TaskRead.from_db(db, task)
+    return SchemaResponse(read, headers=_etag(read.version))
 
 
 async def send_task_update(
     db: Session,
     task: models.Task,
     updated: TaskRead | None,
+    changed: set[str] | None = None,
+    base_version: int | None = None,
 ) -> None:
     """
-    Send updated task information to subscribed users.
+    Send updated task information to subscribed sockets.
 
     If updated is None, we send a deletion notification instead.
+    If the changed fields and the version they were applied on are known, a delta is sent to the sockets
+    which accept them.
+    Cached listings and stats for the owner and every reader are invalidated as well.
     """
-    # Determine recipients
-    # If in the future we want to update the owner as well, we can just add them to this set
-    reader_ids = set(
-        db.execute(select(models.TaskReaders.user_id).where(models.TaskReaders.task_id == task.id)).scalars()
-    )
-
     if updated is None:
-        await manager.send_task_deletion(reader_ids, task.id)
+        reader_ids = set(
+            db.execute(select(models.TaskReaders.user_id).where(models.TaskReaders.task_id == task.id)).scalars()
+        )
+        invalidate_task_caches(db, reader_ids | {task.user_id})
+        await manager.send_task_deletion(task.id, task.user_id, reader_ids)
     else:
-        await manager.send_task_update(reader_ids, updated.model_dump_json())
+        # Readers were already loaded for the response, and socket recipients come from the manager's topic index
+        invalidate_task_caches(db, {*updated.reader_ids, task.user_id})
+        delta = None
+        if changed is not None:
+            delta = {
+                "base_version": base_version,
+                "version": updated.version,
+                "changes": updated.model_dump(mode="json", include=changed | {"updated_at"}),
+            }
+        await manager.send_task_update(task.id, task.user_id, updated.reader_ids, updated.model_dump_json(), delta)
+
+
+@router.get("/{task_id}/responses", response_model=list[AgentResponseRead])
+def list_task_responses(
+    task_id: uuid.UUID,
+    db: DB_SESSION,
+    user: REQUIRE_USER,
+    before: datetime.datetime | None = None,
+    limit: int = Query(20, ge=1, le=100),
+) -> SchemaResponse:
+    """
+    List agent responses of a task, newest first.
+
+    Pages are keyed on creation time: pass the `created_at` of the last response received as `before`.
+    """
+    task = get_task_for_user(db, task_id, user.id, allow_readers=True)
+    query = (
+        select(models.AgentResponse)
+        .where(models.AgentResponse.task_id == task.id)
+        .order_by(models.AgentResponse.created_at.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        # Also skips scanning partitions of later months
+        query = query.where(models.AgentResponse.created_at < before)
+
+    return SchemaResponse([AgentResponseRead.from_db(response) for response in db.execute(query).scalars()])
 
 
 @router.put("/{task_id}", response_model=TaskRead)
-async def update_task(task_id: uuid.UUID, payload: TaskUpdate, db: DB_SESSION, user: REQUIRE_USER) -> TaskRead:
-    task = get_task_for_user(db, task_id, user.id)
-    for field, value in payload.model_dump(exclude_unset=True).items():
-        setattr(task, field, value)
-    db.add(task)
-    db.flush()
-    db.refresh(task)
+async def update_task(
+    task_id: uuid.UUID,
+    payload: TaskUpdate,
+    db: DB_SESSION,
+    user: REQUIRE_USER,
+    if_match: str | None = Header(None),
+) -> SchemaResponse:
+    """
+    Update a task in a single statement.
+
+    The version the client based its edit on can be given in an If-Match header (the ETag of a previous response),
+    or the `version` field, in which case the update fails with a 412 if the task was modified since.
+    """
+    expected_version = _parse_if_match(if_match) if if_match is not None else payload.version
+    values = payload.model_dump(exclude_unset=True, exclude={"version"})
+
+    task = None
+    if values:
+        query = (
+            update(models.Task)
+            .where(
+                models.Task.id == task_id,
+                models.Task.user_id == user.id,
+                # Don't write, or broadcast, updates which change nothing
+                or_(*(getattr(models.Task, field).is_distinct_from(value) for field, value in values.items())),
+            )
+            .values(**values, version=models.Task.version + 1)
+            .returning(models.Task)
+        )
+        if expected_version is not None:
+            query = query.where(models.Task.version == expected_version)
+        task = db.execute(query).scalar_one_or_none()
+
+    if task is None:
+        # Find out why nothing was updated
+        task = get_task_for_user(db, task_id, user.id)
+        if expected_version is not None and task.version != expected_version:
+            raise HTTPException(status_code=412, detail="Task was modified", headers=_etag(task.version))
+        return SchemaResponse(TaskRead.from_db(db, task), headers=_etag(task.version))
 
     # Prepare payload and notify connected websocket clients
     updated = TaskRead.from_db(db, task)
-    await send_task_update(db, task, updated)
+    await send_task_update(db, task, updated, set(values), task.version - 1)
 
-    return updated
+    return SchemaResponse(updated, headers=_etag(updated.version))
 
 
-@router.post("/subscribe/{task_id}/{other_email}", response_model=TaskRead)
-async def subscribe_user(task_id: uuid.UUID, other_email: str, db: DB_SESSION, user: REQUIRE_USER) -> TaskRead:
-    """Allow a user to add another as a viewer to their task."""
-    other_user_query = select(models.User).where(models.User.email == other_email).limit(1)
-    other_user: models.User | None = db.execute(other_user_query).scalar_one_or_none()
-    if other_user is None:
-        raise HTTPException(status_code=404, detail="Other user not found.")
-
-    task = get_task_for_user(db, task_id, user.id)
+async def change_readers(db: Session, task: models.Task, add: set[str], remove: set[str]) -> TaskRead:
+    """
+    Add and remove readers of a task with set-based statements.
 
-    # Check for existing entry
-    existing_query = (
-        select(models.TaskReaders)
-        .where(
-            models.TaskReaders.task_id == task.id,
-            models.TaskReaders.user_id == other_user.id,
+    Each affected user is notified once: new readers and the owner get the updated task,
+    and removed readers are told the task is gone from their dashboard.
+    """
+    users_query = select(models.User.id, models.User.email).where(models.User.email.in_(add | remove))
+    user_ids = {email: user_id for user_id, email in db.execute(users_query)}
+    if unknown := (add | remove) - user_ids.keys():
+        raise HTTPException(status_code=404, detail=f"Users not found: {', '.join(sorted(unknown))}")
+
+    added, removed = set(), set()
+    add_ids = {user_ids[email] for email in add} - {task.user_id}
+    if add_ids:
+        insert_query = (
+            pg_insert(models.TaskReaders)
+            .values([{"task_id": task.id, "user_id": user_id} for user_id in add_ids])
+            .on_conflict_do_nothing()
+            .returning(models.TaskReaders.user_id)
         )
-        .limit(1)
-    )
-
-    if db.execute(existing_query).scalar_one_or_none() is None:
-        db.add(models.TaskReaders(task_id=task.id, user_id=other_user.id))
-        db.flush()
+        added = set(db.execute(insert_query).scalars())
+    if remove:
+        delete_query = (
+            delete(models.TaskReaders)
+            .where(
+                models.TaskReaders.task_id == task.id,
+                models.TaskReaders.user_id.in_([user_ids[email] for email in remove]),
+            )
+            .returning(models.TaskReaders.user_id)
+        )
+        removed = set(db.execute(delete_query).scalars())
 
-    db.refresh(task)
     updated = TaskRead.from_db(db, task)
+    if not added and not removed:
+        # Avoid notifying anyone if nothing changed
+        return updated
+
+    for user_id in added:
+        manager.add_reader(task.id, user_id)
+    for user_id in removed:
+        manager.remove_reader(task.id, user_id)
+    publish_reader_changes(db, task.id, added, removed)
     await send_task_update(db, task, updated)
+
+    if removed:
+        invalidate_task_caches(db, removed)
+        await manager.send_task_removal(removed, task.id)
+
     return updated
 
 
+@router.patch("/{task_id}/readers", response_model=TaskRead)
+async def update_readers(
+    task_id: uuid.UUID,
+    payload: TaskReadersUpdate,
+    db: DB_SESSION,
+    user: REQUIRE_USER,
+) -> TaskRead:
+    """Share a task with, or stop sharing it with, many users at once."""
+    task = get_task_for_user(db, task_id, user.id)
+    return await change_readers(db, task, set(payload.add), set(payload.remove))
+
+
+@router.post("/subscribe/{task_id}/{other_email}", response_model=TaskRead)
+async def subscribe_user(task_id: uuid.UUID, other_email: str, db: DB_SESSION, user: REQUIRE_USER) -> TaskRead:
+    """Allow a user to add another as a viewer to their task."""
+    task = get_task_for_user(db, task_id, user.id)
+    return await change_readers(db, task, add={other_email}, remove=set())
+
+
 @router.delete("/subscribe/{task_id}/{other_email}", response_model=TaskRead)
 async def unsubscribe_user(task_id: uuid.UUID, other_email: str, db: DB_SESSION, user: REQUIRE_USER) -> TaskRead:
-    other_user_query = select(models.User).where(models.User.email == other_email).limit(1)
-    other_user: models.User | None = db.execute(other_user_query).scalar_one_or_none()
-    if other_user is None:
-        raise HTTPException(status_code=404, detail="Other user not found.")
-
     # Ensure the task exists and is owned by the current user, or can be operated on as selected
     task = get_task_for_user(db, task_id, user.id, allow_readers=True)
     if task.user_id != user.id and user.email != other_email:
         raise HTTPException(status_code=400, detail="No permission to remove this user.")
 
-    if not any(other_user.id == reader.user_id for reader in task.readers):
-        # Avoid performing additional operations if the subscription doesn't exist
-        return TaskRead.from_db(db, task)
-
-    delete_query = delete(models.TaskReaders).where(
-        models.TaskReaders.task_id == task_id,
-        models.TaskReaders.user_id == other_user.id,
-    )
-    db.execute(delete_query)
-    db.flush()
-
-    db.refresh(task)
-    updated = TaskRead.from_db(db, task)
-    await send_task_update(db, task, updated)
-
-    # We also need to tell the removed user that the task is gone from their dashboard
-    await manager.send_task_deletion({other_user.id}, task_id)
-
-    return updated
+    return await change_readers(db, task, add=set(), remove={other_email})
 
 
 @router.delete("/{task_id}", status_code=204)
@@ -182,5 +470,6 @@ async def delete_task(task_id: uuid.UUID, db: DB_SESSION, user: REQUIRE_USER) ->
     task = get_task_for_user(db, task_id, user.id)
     # Notify about deletion before we perform the deletion, so we can get the subscribed user list
     await send_task_update(db, task, None)
-    db.delete(task)
+    # Responses and readers are removed by the database's cascades, without loading them
+    db.execute(delete(models.Task).where(models.Task.id == task.id))
     return None
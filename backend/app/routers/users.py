@@ -1,12 +1,14 @@
+import uuid
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from passlib.context import CryptContext
-from sqlalchemy import select
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 
 from app import models
+from app.admission import admit
 from app.auth import (
     REQUIRE_ADMIN_PATH,
     REQUIRE_USER,
@@ -15,6 +17,7 @@ from app.auth import (
 )
 from app.config import get_settings
 from app.db import DB_SESSION
+from app.routers.tasks import invalidate_task_caches
 from app.schemas.users import (
     RefreshRequest,
     TokenPair,
@@ -34,7 +37,19 @@ def get_user_by_email(db: Session, email: str) -> models.User | None:
     return db.execute(user_query).scalar_one_or_none()
 
 
-@router.post("/token")
+def _shared_with(db: Session, email: str) -> set[uuid.UUID]:
+    """Users some task of the given user is shared with."""
+    query = (
+        select(models.TaskReaders.user_id)
+        .join(models.Task, models.Task.id == models.TaskReaders.task_id)
+        .join(models.User, models.User.id == models.Task.user_id)
+        .where(models.User.email == email)
+        .distinct()
+    )
+    return set(db.execute(query).scalars())
+
+
+@router.post("/token", dependencies=[admit("password")])
 def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: DB_SESSION) -> TokenPair:
     user = get_user_by_email(db, form_data.username)
     if user is None:
@@ -75,12 +90,15 @@ def get_user(email: str, db: DB_SESSION) -> UserRead:
     return UserRead.from_db(user)
 
 
-@router.put("/{email}", response_model=UserRead, dependencies=[REQUIRE_ADMIN_PATH])
+@router.put("/{email}", response_model=UserRead, dependencies=[REQUIRE_ADMIN_PATH, admit("password")])
 def update_user(email: str, data: UserUpdate, db: DB_SESSION) -> UserRead:
     user = get_user_by_email(db, email)
     if user is None:
         raise HTTPException(status_code=404)
 
+    if data.email not in (None, user.email) or data.name not in (None, user.name):
+        # Listings show the owner's name and email, in the user's own listings and those of their readers
+        invalidate_task_caches(db, _shared_with(db, email) | {user.id})
     user.email = data.email if data.email is not None else user.email
     user.name = data.name if data.name is not None else user.name
     user.password_hash = pwd_context.hash(data.password) if data.password is not None else user.password_hash
@@ -93,13 +111,12 @@ def update_user(email: str, data: UserUpdate, db: DB_SESSION) -> UserRead:
 
 @router.delete("/{email}", dependencies=[REQUIRE_ADMIN_PATH], status_code=204)
 def delete_user(email: str, db: DB_SESSION) -> None:
-    user = get_user_by_email(db, email)
-    if user is None:
-        return
-    db.delete(user)
+    # The user's tasks, their responses and readers are removed by the database's cascades
+    invalidate_task_caches(db, _shared_with(db, email))
+    db.execute(delete(models.User).where(models.User.email == email))
 
 
-@router.post("/", response_model=UserRead, status_code=201)
+@router.post("/", response_model=UserRead, status_code=201, dependencies=[admit("password")])
 def create_user(new_user: UserCreate, db: DB_SESSION) -> UserRead:
     # Check if the user already exists
     existing = get_user_by_email(db, new_user.email)
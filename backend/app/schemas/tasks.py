@@ -2,7 +2,7 @@ import datetime
 import uuid
 from typing import Self
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from sqlalchemy.orm import Session
 
 from app import models
@@ -36,6 +36,21 @@ class TaskUpdate(BaseModel):
     priority: TaskPriority | None = None
     status: TaskStatus | None = None
     deadline: datetime.datetime | None = None
+    # The version this update was based on, rejected if the task was modified since
+    version: int | None = None
+
+
+class TaskReadersUpdate(BaseModel):
+    """Readers to add to and remove from a task, by email."""
+
+    add: list[str] = Field(default_factory=list, max_length=100)
+    remove: list[str] = Field(default_factory=list, max_length=100)
+
+    @model_validator(mode="after")
+    def disjoint(self) -> Self:
+        if set(self.add) & set(self.remove):
+            raise ValueError("The same user can't be both added and removed")
+        return self
 
 
 class TaskSummary(BaseModel):
@@ -66,15 +81,54 @@ class TaskRead(TaskBase):
     id: uuid.UUID
     created_at: datetime.datetime
     updated_at: datetime.datetime
+    version: int
     user_id: uuid.UUID
     owner_name: str = ""
     owner_email: str = ""
     reader_emails: list[str] = Field(default_factory=list)
+    # Kept for server-side use (e.g. cache invalidation), never serialized
+    reader_ids: list[uuid.UUID] = Field(default_factory=list, exclude=True)
 
     @classmethod
     def from_db(cls, db: Session, task: models.Task) -> Self:
         result = cls.model_validate(task)
         result.owner_name = task.user.name
         result.owner_email = task.user.email
-        result.reader_emails = task.get_reader_emails(db)
+        readers = task.get_readers(db)
+        result.reader_ids = [user_id for user_id, _ in readers]
+        result.reader_emails = [email for _, email in readers]
         return result
+
+
+class TaskExport(TaskBase):
+    """Task fields written by exports. Importing them back creates new tasks, with their own ids and dates."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: uuid.UUID
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+
+
+class TaskImportError(BaseModel):
+    line: int
+    detail: str
+
+
+class TaskImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    # Only the first errors are listed
+    errors: list[TaskImportError] = Field(default_factory=list)
+    duration_ms: float = 0
+
+
+class TaskStats(BaseModel):
+    """Dashboard counters over all tasks visible to a user."""
+
+    total: int = 0
+    by_status: dict[TaskStatus, int] = Field(default_factory=lambda: {status: 0 for status in TaskStatus})
+    by_priority: dict[TaskPriority, int] = Field(default_factory=lambda: {priority: 0 for priority in TaskPriority})
+    # Only incomplete tasks are counted as overdue or due soon
+    overdue: int = 0
+    due_soon: int = 0
@@ -0,0 +1,122 @@
+"""
+Partition management and retention of agent responses.
+
+`agent_responses` is partitioned by month of creation. Partitions are created `AGENT_RESPONSE_PARTITIONS_AHEAD`
+months in advance, and dropped once all their responses are older than `AGENT_RESPONSE_RETENTION`. Dropping a
+partition is instant and returns its space right away, unlike deleting rows.
+
+Run daily with `python -m app.services.retention`.
+"""
+
+import argparse
+import datetime
+import logging
+import re
+import sys
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.db import SessionFactory
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PARENT_TABLE = "agent_responses"
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+# Arbitrary advisory lock key, serializing partition changes between replicas starting at the same time
+_LOCK_KEY = 1_937_006_385
+
+
+def month_start(moment: datetime.datetime) -> datetime.datetime:
+    return moment.astimezone(datetime.timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime.datetime, months: int) -> datetime.datetime:
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=month_index + 1)
+
+
+def partition_name(month: datetime.datetime) -> str:
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+
+def existing_partitions(db: Session) -> dict[str, datetime.datetime]:
+    """Map the names of the monthly partitions to the start of their month."""
+    query = text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass)"
+    )
+    partitions = {}
+    for name in db.execute(query, {"parent": PARENT_TABLE}).scalars():
+        if match := _PARTITION_NAME.match(name):
+            year, month = map(int, match.groups())
+            partitions[name] = datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+    return partitions
+
+
+def expired_partitions(partitions: dict[str, datetime.datetime], cutoff: datetime.datetime) -> list[str]:
+    """Names of the partitions whose whole month is before the cutoff."""
+    return sorted(name for name, month in partitions.items() if add_months(month, 1) <= cutoff)
+
+
+def ensure_partitions(db: Session, now: datetime.datetime, ahead: int) -> list[str]:
+    """Create any missing partitions from the current month until `ahead` months later."""
+    existing = existing_partitions(db)
+    created = []
+    month = month_start(now)
+    for _ in range(ahead + 1):
+        name = partition_name(month)
+        if name not in existing:
+            # Partition bounds can't be bound parameters, but they are always generated here
+            db.execute(
+                text(
+                    f'CREATE TABLE "{name}" PARTITION OF "{PARENT_TABLE}" '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+            )
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def drop_expired_partitions(db: Session, now: datetime.datetime, retention: datetime.timedelta) -> list[str]:
+    dropped = expired_partitions(existing_partitions(db), now - retention)
+    for name in dropped:
+        db.execute(text(f'DROP TABLE "{name}"'))
+    return dropped
+
+
+def run(drop_expired: bool = True) -> None:
+    """Create upcoming partitions, and drop expired ones unless disabled."""
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    with SessionFactory() as db:
+        db.execute(select(func.pg_advisory_xact_lock(_LOCK_KEY)))
+        created = ensure_partitions(db, now, settings.AGENT_RESPONSE_PARTITIONS_AHEAD)
+        dropped = drop_expired_partitions(db, now, settings.AGENT_RESPONSE_RETENTION) if drop_expired else []
+        db.commit()
+
+    if created:
+        logger.info(f"Created agent response partitions: {', '.join(created)}")
+    if dropped:
+        logger.info(f"Dropped expired agent response partitions: {', '.join(dropped)}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.services.retention", description=__doc__.split("\n\n")[0].strip()
+    )
+    parser.add_argument("--create-only", action="store_true", help="Only create upcoming partitions.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    run(drop_expired=not args.create_only)
+    return 0
+
+
+__all__ = ["ensure_partitions", "drop_expired_partitions", "run"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Bulk export and import of tasks, as NDJSON or CSV.
+
+Exports are read through a server-side cursor and encoded a batch at a time, and imports are parsed from the
+upload as it arrives and loaded with `COPY` a batch at a time, so memory use doesn't depend on the number of tasks.
+"""
+
+import codecs
+import csv
+import io
+import uuid
+from typing import Callable, Iterator, Literal, TypeAlias
+
+from pydantic import ValidationError
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import get_settings
+from app.db import SessionFactory
+from app.schemas.tasks import TaskCreate, TaskExport
+
+settings = get_settings()
+
+TransferFormat: TypeAlias = Literal["ndjson", "csv"]
+
+MEDIA_TYPES: dict[TransferFormat, str] = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = list(TaskExport.model_fields)
+BATCH_SIZE = 1000
+# In characters, far above the longest valid task, so invalid ones are still reported rather than rejecting the upload
+MAX_RECORD_LENGTH = 64 * 1024
+
+# Columns loaded by COPY, the others are filled by their server defaults
+_COPY_COLUMNS = ("id", "title", "description", "priority", "status", "deadline", "user_id")
+
+
+def export_query(user_id: uuid.UUID) -> Select:
+    """Tasks owned by a user, oldest first. Tasks shared with the user are left to their owners to export."""
+    columns = [getattr(models.Task, field) for field in EXPORT_FIELDS]
+    return (
+        select(*columns)
+        .where(models.Task.user_id == user_id)
+        .order_by(models.Task.created_at)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+
+
+def _encode_ndjson(tasks: list[TaskExport]) -> bytes:
+    return b"".join(task.model_dump_json().encode() + b"\n" for task in tasks)
+
+
+def _encode_csv(tasks: list[TaskExport], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for task in tasks:
+        writer.writerow("" if value is None else value for value in task.model_dump(mode="json").values())
+    return buffer.getvalue().encode()
+
+
+def export_tasks(user_id: uuid.UUID, fmt: TransferFormat) -> Iterator[bytes]:
+    """
+    Encode the tasks owned by a user, one chunk per batch.
+
+    Uses its own session, as the body is streamed after the request's session is closed. Only columns are selected,
+    so rows don't go through the session's identity map, and `yield_per` reads them through a server-side cursor.
+    """
+    if fmt == "csv":
+        yield _encode_csv([], header=True)
+    with SessionFactory() as db:
+        for rows in db.execute(export_query(user_id)).partitions():
+            tasks = [TaskExport.model_validate(row) for row in rows]
+            yield _encode_ndjson(tasks) if fmt == "ndjson" else _encode_csv(tasks, header=False)
+
+
+class ImportTooLarge(ValueError):
+    """An upload, or one of its records, is over its size limit."""
+
+
+class ImportParser:
+    """
+    Split an upload into tasks as its chunks arrive, NDJSON lines or CSV records.
+
+    `feed` returns `(line, task)` pairs, where `task` is the validation error message for invalid records. CSV
+    uploads need a header row, their unknown columns are ignored, so exports can be imported back.
+
+    Raises `ImportTooLarge` once the upload is over `max_bytes`, or a record over `max_record_length`, so memory and
+    parsing time stay bounded whatever the upload.
+    """
+
+    def __init__(
+        self,
+        fmt: TransferFormat,
+        max_bytes: int = settings.TASK_IMPORT_MAX_BYTES,
+        max_record_length: int = MAX_RECORD_LENGTH,
+    ):
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_record_length = max_record_length
+        self._received = 0
+        # Spreadsheet software often prefixes UTF-8 files with a BOM
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buffer = ""
+        self._line = 0
+        # CSV records continue over several lines while a quoted field is open, i.e. on an odd number of quotes,
+        # counted a line at a time
+        self._record: list[str] = []
+        self._record_length = 0
+        self._record_quotes = 0
+        self._record_line = 0
+        self._header: list[str] | None = None
+
+    def feed(self, chunk: bytes) -> list[tuple[int, TaskCreate | str]]:
+        self._received += len(chunk)
+        if self._received > self.max_bytes:
+            raise ImportTooLarge(f"Imports are limited to {self.max_bytes} bytes")
+        # Only the new text is split, so a line arriving over many chunks isn't scanned again for each
+        *lines, rest = self._decoder.decode(chunk).split("\n")
+        if lines:
+            lines[0] = self._buffer + lines[0]
+            self._buffer = rest
+        else:
+            self._buffer += rest
+        if len(self._buffer) > self.max_record_length:
+            raise self._record_too_long(self._line + len(lines) + 1)
+        return [task for line in lines if (task := self._parse_line(line)) is not None]
+
+    def close(self) -> list[tuple[int, TaskCreate | str]]:
+        self._buffer += self._decoder.decode(b"", final=True)
+        tasks = []
+        if self._buffer and (task := self._parse_line(self._buffer)) is not None:
+            tasks.append(task)
+        self._buffer = ""
+        if self._record:
+            tasks.append((self._record_line, "Unterminated quoted field"))
+            self._record = []
+        return tasks
+
+    def _record_too_long(self, line: int) -> ImportTooLarge:
+        return ImportTooLarge(f"Line {line}: records are limited to {self.max_record_length} characters")
+
+    def _parse_line(self, line: str) -> tuple[int, TaskCreate | str] | None:
+        self._line += 1
+        if len(line) > self.max_record_length:
+            raise self._record_too_long(self._line)
+        if self.fmt == "ndjson":
+            if not line.strip():
+                return None
+            return self._line, self._validate(lambda: TaskCreate.model_validate_json(line))
+
+        if not self._record:
+            if not line.strip():
+                return None
+            self._record_line = self._line
+            self._record_length = 0
+            self._record_quotes = 0
+        self._record.append(line)
+        self._record_length += len(line) + 1
+        if self._record_length > self.max_record_length:
+            raise self._record_too_long(self._record_line)
+        self._record_quotes += line.count('"')
+        if self._record_quotes % 2:
+            return None
+        [values] = csv.reader(["\n".join(self._record).removesuffix("\r")])
+        self._record = []
+
+        if self._header is None:
+            self._header = [name.strip() for name in values]
+            return None
+        if len(values) != len(self._header):
+            return self._record_line, f"Expected {len(self._header)} fields, got {len(values)}"
+        # CSV has no null, so empty fields take their defaults
+        fields = {name: value for name, value in zip(self._header, values) if value and name in TaskCreate.model_fields}
+        fields.setdefault("description", "")
+        return self._record_line, self._validate(lambda: TaskCreate.model_validate(fields))
+
+    @staticmethod
+    def _validate(parse: Callable[[], TaskCreate]) -> TaskCreate | str:
+        try:
+            return parse()
+        except ValidationError as e:
+            return "; ".join(f"{'.'.join(map(str, error['loc'])) or 'task'}: {error['msg']}" for error in e.errors())
+
+
+def copy_tasks(db: Session, user_id: uuid.UUID, tasks: list[TaskCreate]) -> None:
+    """Insert tasks for a user with `COPY`, in the session's transaction."""
+    cursor = db.connection().connection.driver_connection.cursor()
+    columns = ", ".join(_COPY_COLUMNS)
+    with cursor, cursor.copy(f"COPY {models.Task.__tablename__} ({columns}) FROM STDIN") as copy:
+        for task in tasks:
+            # Postgres enums hold the names of the python enums, not their values
+            copy.write_row(
+                (
+                    uuid.uuid4(),
+                    task.title,
+                    task.description,
+                    task.priority.name,
+                    task.status.name,
+                    task.deadline,
+                    user_id,
+                )
+            )
+
+
+__all__ = [
+    "MEDIA_TYPES",
+    "BATCH_SIZE",
+    "MAX_RECORD_LENGTH",
+    "TransferFormat",
+    "ImportParser",
+    "ImportTooLarge",
+    "copy_tasks",
+    "export_query",
+    "export_tasks",
+]
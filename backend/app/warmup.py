@@ -0,0 +1,135 @@
+"""
+Startup warm-up, reported by the `/ready` endpoint.
+
+Right after a rollout, the first requests of a process would otherwise pay for opening database connections,
+and for SQLAlchemy compiling the hot statements on first use. The warm-up runs in the background on startup,
+retrying until the database is reachable, so liveness checks pass while readiness waits for it.
+"""
+
+import asyncio
+import datetime
+import itertools
+import logging
+import time
+import uuid
+from typing import Callable
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from app import models
+from app.auth import user_query
+from app.config import get_settings
+from app.db import ReadSessionFactory, SessionFactory, engine
+from app.responses import SchemaResponse
+from app.routers.tasks import list_tasks_query, task_query, task_stats_query
+from app.schemas.tasks import TaskRead, TaskStats, TaskSummary
+from app.services import retention
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class WarmUp:
+    def __init__(self, connections: int):
+        # Connections past the pool size would be closed as soon as they are returned
+        self.connections = min(connections, engine.pool.size())
+        self.ready = False
+        self.attempts = 0
+        self.timings: dict[str, float] = {}
+        self.error: str | None = None
+
+    def _step(self, name: str, step: Callable[[], None]) -> None:
+        start = time.perf_counter()
+        step()
+        self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _open_connections(self) -> None:
+        # Check all connections out at once, so the pool has to open each of them
+        connections = [engine.connect() for _ in range(self.connections)]
+        try:
+            for connection in connections:
+                connection.execute(text("SELECT 1"))
+        finally:
+            for connection in connections:
+                connection.close()
+
+    def _run_statements(self) -> None:
+        """Run the statements behind authentication and the task endpoints, filling the compiled statement cache."""
+        user_id, task_id = uuid.uuid4(), uuid.uuid4()
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        # The pool hands out connections in turn, so each of them also prepares its own catalog caches
+        for _, factory in itertools.product(range(self.connections), (SessionFactory, ReadSessionFactory)):
+            with factory() as db:
+                db.execute(user_query("warm-up@localhost")).all()
+                db.execute(list_tasks_query(user_id, 0, 50)).all()
+                db.execute(task_stats_query(user_id, now)).all()
+                db.execute(task_query(task_id)).all()
+                models.Task(id=task_id).get_readers(db)
+
+    @staticmethod
+    def _render_responses() -> None:
+        summary = TaskSummary(
+            id=uuid.uuid4(),
+            title="Warm-up",
+            priority=models.TaskPriority.medium,
+            status=models.TaskStatus.pending,
+            deadline=None,
+            user_id=uuid.uuid4(),
+        )
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        read = TaskRead(**summary.model_dump(), description="", created_at=now, updated_at=now, version=1)
+        SchemaResponse([summary])
+        SchemaResponse(read)
+        SchemaResponse(TaskStats())
+
+    def run(self) -> None:
+        self.attempts += 1
+        self.timings = {}
+        self._step("connections", self._open_connections)
+        self._step("statements", self._run_statements)
+        self._step("responses", self._render_responses)
+        self.ready = True
+        self.error = None
+
+    async def run_until_ready(self, retry_interval: float = 5) -> None:
+        start = time.perf_counter()
+        while True:
+            try:
+                await run_in_threadpool(self.run)
+            except Exception as e:
+                # Only the type is reported, as the message may include connection details
+                self.error = type(e).__name__
+                logger.warning(f"Warm-up attempt {self.attempts} failed, retrying in {retry_interval}s", exc_info=e)
+                await asyncio.sleep(retry_interval)
+            else:
+                self.timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+                logger.info(f"Warm-up complete: {self.timings}")
+                await self._create_partitions()
+                return
+
+    @staticmethod
+    async def _create_partitions() -> None:
+        """
+        Make sure agent responses can be stored even where the retention job isn't scheduled.
+
+        Runs once the database is known to be reachable, but doesn't hold readiness: the DDL may wait on locks, or
+        keep failing, and only the storage of agent responses depends on it.
+        """
+        try:
+            await run_in_threadpool(retention.run, drop_expired=False)
+        except Exception as e:
+            logger.error("Could not create agent response partitions", exc_info=e)
+
+    def report(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "attempts": self.attempts,
+            "timings_ms": self.timings,
+            "error": self.error,
+        }
+
+
+warmup = WarmUp(connections=settings.DB_WARM_CONNECTIONS)
+
+__all__ = ["WarmUp", "warmup"]
@@ -0,0 +1 @@
+"""Load and benchmark suite for the backend. See the README for usage."""
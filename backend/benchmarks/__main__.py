@@ -0,0 +1,131 @@
+"""
+Command line entrypoint for the benchmark suite.
+
+Seed a database, then run the suite against a running server:
+
+    python -m benchmarks seed --users 200 --tasks-per-user 50 --readers-per-task 3 --fanout-readers 25
+    python -m benchmarks run --base-url http://localhost:8000 --save benchmarks/baselines/main.json
+
+Later runs can be compared against a saved baseline, exiting with a non-zero status on regressions:
+
+    python -m benchmarks run --compare benchmarks/baselines/main.json
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+from benchmarks import broadcast, load, results, serialization
+from benchmarks.seed import SeedManifest, clear, seed
+
+DEFAULT_MANIFEST = Path(__file__).parent / "baselines" / "seed.json"
+
+logger = logging.getLogger("benchmarks")
+
+
+def _seed(args: argparse.Namespace) -> int:
+    clear()
+    manifest = seed(
+        users=args.users,
+        tasks_per_user=args.tasks_per_user,
+        readers_per_task=args.readers_per_task,
+        fanout_readers=args.fanout_readers,
+        random_seed=args.random_seed,
+    )
+    manifest.save(args.manifest)
+    logger.info(f"Wrote seed manifest to {args.manifest}")
+    return 0
+
+
+def _run(args: argparse.Namespace) -> int:
+    manifest = SeedManifest.load(args.manifest)
+    scenarios = tuple(args.scenarios.split(",")) if args.scenarios else load.SCENARIOS
+    current = asyncio.run(
+        load.run(
+            args.base_url,
+            manifest,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            scenarios=scenarios,
+            random_seed=args.random_seed,
+        )
+    )
+    print(results.format_table(current))
+
+    if args.save:
+        params = {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": manifest.users,
+            "tasks_per_user": manifest.tasks_per_user,
+            "readers_per_task": manifest.readers_per_task,
+            "fanout_readers": manifest.fanout_readers,
+        }
+        results.save_baseline(args.save, params, current)
+        logger.info(f"Saved results to {args.save}")
+
+    if args.compare:
+        regressions = results.compare(results.load_baseline(args.compare), current, args.tolerance)
+        if regressions:
+            print("\nRegressions detected:")
+            print("\n".join(f"  - {regression}" for regression in regressions))
+            return 1
+        print(f"\nNo regressions against {args.compare}")
+
+    return 0
+
+
+def _serialization(args: argparse.Namespace) -> int:
+    print(results.format_table(serialization.run(size=args.size, iterations=args.iterations)))
+    return 0
+
+
+def _broadcast(args: argparse.Namespace) -> int:
+    print(broadcast.format_table(broadcast.run(events=args.events, sockets=args.sockets, readers=args.readers)))
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST, help="Seed manifest location.")
+    parser.add_argument("--random-seed", type=int, default=0)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Replace benchmark data in the configured DATABASE_URL.")
+    seed_parser.add_argument("--users", type=int, default=100)
+    seed_parser.add_argument("--tasks-per-user", type=int, default=20)
+    seed_parser.add_argument("--readers-per-task", type=int, default=2)
+    seed_parser.add_argument("--fanout-readers", type=int, default=10, help="Readers connected during updates.")
+    seed_parser.set_defaults(handler=_seed)
+
+    run_parser = commands.add_parser("run", help="Run the load scenarios against a running server.")
+    run_parser.add_argument("--base-url", default="http://localhost:8000")
+    run_parser.add_argument("--requests", type=int, default=500, help="Requests per scenario.")
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--scenarios", help=f"Comma separated subset of: {','.join(load.SCENARIOS)}")
+    run_parser.add_argument("--save", type=Path, help="Save results as a JSON baseline.")
+    run_parser.add_argument("--compare", type=Path, help="Compare results against a JSON baseline.")
+    run_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression fraction.")
+    run_parser.set_defaults(handler=_run)
+
+    serialization_parser = commands.add_parser("serialization", help="Benchmark response serialization in-process.")
+    serialization_parser.add_argument("--size", type=int, default=100, help="Items in the serialized listing.")
+    serialization_parser.add_argument("--iterations", type=int, default=2000)
+    serialization_parser.set_defaults(handler=_serialization)
+
+    broadcast_parser = commands.add_parser("broadcast", help="Benchmark websocket broadcast encodings in-process.")
+    broadcast_parser.add_argument("--events", type=int, default=1000, help="Task updates broadcast per mode.")
+    broadcast_parser.add_argument("--sockets", type=int, default=50, help="Sockets receiving each update.")
+    broadcast_parser.add_argument("--readers", type=int, default=25, help="Readers listed in the task.")
+    broadcast_parser.set_defaults(handler=_broadcast)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
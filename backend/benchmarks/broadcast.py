@@ -0,0 +1,112 @@
+"""
+Compare the size and cost of websocket broadcasts, per encoding, with and without permessage-deflate.
+
+Task updates are broadcast through a `ConnectionManager` to in-memory sockets. Compressed sockets deflate frames
+like permessage-deflate does with context takeover, uvicorn's default, each with its own compressor.
+"""
+
+import asyncio
+import datetime
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+
+from app.models import TaskPriority, TaskStatus
+from app.routers.sockets import ConnectionManager, Encoding
+from app.schemas.tasks import TaskRead
+
+MODES: dict[str, tuple[Encoding, bool]] = {
+    "json": ("json", False),
+    "json+deflate": ("json", True),
+    "msgpack": ("msgpack", False),
+    "msgpack+deflate": ("msgpack", True),
+}
+
+
+@dataclass
+class BroadcastResult:
+    events: int
+    sockets: int
+    # Payload bytes sent to each socket, excluding frame headers
+    bytes_per_event: float
+    cpu_ms_per_broadcast: float
+
+
+class _Socket:
+    def __init__(self, deflate: bool):
+        # Raw deflate streams, flushed after each message, without the 4 bytes trailer the extension strips
+        self._compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS) if deflate else None
+        self.bytes_received = 0
+
+    async def send_text(self, frame: str) -> None:
+        await self.send_bytes(frame.encode())
+
+    async def send_bytes(self, frame: bytes) -> None:
+        if self._compressor is not None:
+            frame = (self._compressor.compress(frame) + self._compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+        self.bytes_received += len(frame)
+
+
+def _updates(count: int, readers: int) -> list[TaskRead]:
+    """Updates of distinct tasks from a single owner, shared with the same readers."""
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    owner_id = uuid.uuid4()
+    statuses, priorities = list(TaskStatus), list(TaskPriority)
+    reader_emails = [f"bench-reader-{i}@bench.local" for i in range(readers)]
+    return [
+        TaskRead(
+            id=uuid.uuid4(),
+            title=f"Task {i}",
+            description=f"Description of task {i}, edited by one of its readers.",
+            priority=priorities[i % len(priorities)],
+            status=statuses[i % len(statuses)],
+            deadline=now + datetime.timedelta(hours=i),
+            created_at=now - datetime.timedelta(days=1),
+            updated_at=now + datetime.timedelta(seconds=i),
+            version=i % 10 + 2,
+            user_id=owner_id,
+            owner_name="Bench User",
+            owner_email="bench-user@bench.local",
+            reader_emails=reader_emails,
+        )
+        for i in range(count)
+    ]
+
+
+async def _broadcast(updates: list[TaskRead], sockets: int, encoding: Encoding, deflate: bool) -> BroadcastResult:
+    manager = ConnectionManager(max_connections_per_user=sockets, idle_timeout=60)
+    owner_id = updates[0].user_id
+    clients = [_Socket(deflate) for _ in range(sockets)]
+    for client in clients:
+        await manager.register(client, owner_id, encoding=encoding)
+        manager.subscribe(client, {"mine"})
+
+    cpu = 0.0
+    for update in updates:
+        start = time.process_time()
+        await manager.send_task_update(update.id, owner_id, (), update.model_dump_json())
+        cpu += time.process_time() - start
+
+    return BroadcastResult(
+        events=len(updates),
+        sockets=sockets,
+        bytes_per_event=round(sum(client.bytes_received for client in clients) / sockets / len(updates), 1),
+        cpu_ms_per_broadcast=round(cpu * 1000 / len(updates), 4),
+    )
+
+
+def run(events: int = 1000, sockets: int = 50, readers: int = 25) -> dict[str, BroadcastResult]:
+    updates = _updates(events, readers)
+    return {
+        name: asyncio.run(_broadcast(updates, sockets, encoding, deflate))
+        for name, (encoding, deflate) in MODES.items()
+    }
+
+
+def format_table(results: dict[str, BroadcastResult]) -> str:
+    header = f"{'mode':<18}{'events':>8}{'sockets':>9}{'bytes/event':>13}{'cpu ms/broadcast':>18}"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        lines.append(f"{name:<18}{r.events:>8}{r.sockets:>9}{r.bytes_per_event:>13.1f}{r.cpu_ms_per_broadcast:>18.4f}")
+    return "\n".join(lines)
@@ -0,0 +1,215 @@
+"""Drive the HTTP and websocket endpoints of a running server and collect latencies."""
+
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+import httpx
+from websockets.asyncio.client import ClientConnection, connect
+
+from benchmarks.results import ScenarioResult, summarize
+from benchmarks.seed import SeedManifest
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("login", "list_tasks", "get_task", "update_task", "analyze")
+
+PING_FRAME = '{"event":"ping"}'
+PONG_FRAME = '{"event":"pong"}'
+
+RequestFactory = Callable[[int], Awaitable[httpx.Response]]
+
+
+async def _run_requests(make_request: RequestFactory, total: int, concurrency: int) -> ScenarioResult:
+    """Issue `total` requests from `concurrency` workers, recording the latency of each."""
+    counter = itertools.count()
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while (index := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                response = await make_request(index)
+                failed = response.status_code >= 400
+            except httpx.HTTPError as e:
+                logger.debug("Benchmark request failed", exc_info=e)
+                failed = True
+            elapsed = time.perf_counter() - start
+            if failed:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> httpx.Response:
+    return await client.post("/users/token", data={"username": email, "password": password})
+
+
+async def _get_tokens(client: httpx.AsyncClient, emails: list[str], password: str) -> dict[str, str]:
+    tokens = {}
+    for email in emails:
+        response = await _login(client, email, password)
+        response.raise_for_status()
+        tokens[email] = response.json()["access_token"]
+    return tokens
+
+
+class _FanoutReaders:
+    """A group of websocket readers used to measure the delivery latency of task update broadcasts."""
+
+    def __init__(self, ws_url: str, tokens: list[str]):
+        self._ws_url = ws_url
+        self._tokens = tokens
+        self._sockets: list[ClientConnection] = []
+
+    async def __aenter__(self) -> "_FanoutReaders":
+        for token in self._tokens:
+            self._sockets.append(await connect(f"{self._ws_url}/ws/tasks?token={token}"))
+        return self
+
+    async def __aexit__(self, *_exc) -> None:
+        await asyncio.gather(*(ws.close() for ws in self._sockets))
+
+    async def wait_for_frame(self, timeout: float) -> float | None:
+        """Wait until every reader received a frame, and return the arrival time of the last one."""
+
+        async def receive(ws: ClientConnection) -> float:
+            while (await ws.recv()) == PING_FRAME:
+                await ws.send(PONG_FRAME)
+            return time.perf_counter()
+
+        try:
+            arrivals = await asyncio.wait_for(asyncio.gather(*(receive(ws) for ws in self._sockets)), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return max(arrivals)
+
+
+async def _run_update_fanout(
+    client: httpx.AsyncClient,
+    ws_url: str,
+    owner_token: str,
+    reader_tokens: list[str],
+    task_id: str,
+    total: int,
+) -> tuple[ScenarioResult, ScenarioResult]:
+    """
+    Update a shared task while its readers are connected.
+
+    Updates are issued one at a time, so each broadcast can be attributed to the request that caused it.
+    Returns the results for the request itself, and for the delivery to every connected reader.
+    """
+    priorities = ["Low", "Medium", "High"]
+    headers = {"Authorization": f"Bearer {owner_token}"}
+    request_latencies, fanout_latencies = [], []
+    request_errors = fanout_errors = 0
+
+    async with _FanoutReaders(ws_url, reader_tokens) as readers:
+        start = time.perf_counter()
+        for index in range(total):
+            sent = time.perf_counter()
+            try:
+                response = await client.put(
+                    f"/tasks/{task_id}", json={"priority": priorities[index % 3]}, headers=headers
+                )
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+
+            if failed:
+                request_errors += 1
+                continue
+            request_latencies.append(time.perf_counter() - sent)
+
+            if reader_tokens:
+                delivered = await readers.wait_for_frame(timeout=5)
+                if delivered is None:
+                    fanout_errors += 1
+                else:
+                    fanout_latencies.append(delivered - sent)
+        duration = time.perf_counter() - start
+
+    return (
+        summarize(request_latencies, request_errors, duration),
+        summarize(fanout_latencies, fanout_errors, duration),
+    )
+
+
+async def run(
+    base_url: str,
+    manifest: SeedManifest,
+    requests: int,
+    concurrency: int,
+    scenarios: tuple[str, ...] = SCENARIOS,
+    random_seed: int = 0,
+) -> dict[str, ScenarioResult]:
+    rng = random.Random(random_seed)
+    ws_url = base_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+    owner = manifest.emails[0]
+    results: dict[str, ScenarioResult] = {}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        tokens = await _get_tokens(client, [owner, *manifest.hot_task_readers], manifest.password)
+        owner_headers = {"Authorization": f"Bearer {tokens[owner]}"}
+
+        # Pick a random subset of users to spread list requests over
+        list_users = rng.sample(manifest.emails, min(len(manifest.emails), 20))
+        tokens.update(await _get_tokens(client, [e for e in list_users if e not in tokens], manifest.password))
+
+        owned = await client.get("/tasks/", params={"limit": 100}, headers=owner_headers)
+        owned.raise_for_status()
+        task_ids = [task["id"] for task in owned.json() if task["owner_email"] == owner]
+
+        if "login" in scenarios:
+            # Password hashing dominates here, so this is kept separate from the other scenarios
+            results["login"] = await _run_requests(
+                lambda i: _login(client, manifest.emails[i % len(manifest.emails)], manifest.password),
+                requests,
+                concurrency,
+            )
+
+        if "list_tasks" in scenarios:
+            results["list_tasks"] = await _run_requests(
+                lambda i: client.get(
+                    "/tasks/", headers={"Authorization": f"Bearer {tokens[list_users[i % len(list_users)]]}"}
+                ),
+                requests,
+                concurrency,
+            )
+
+        if "get_task" in scenarios:
+            results["get_task"] = await _run_requests(
+                lambda i: client.get(f"/tasks/{task_ids[i % len(task_ids)]}", headers=owner_headers),
+                requests,
+                concurrency,
+            )
+
+        if "update_task" in scenarios:
+            results["update_task"], results["ws_fanout"] = await _run_update_fanout(
+                client,
+                ws_url,
+                tokens[owner],
+                [tokens[email] for email in manifest.hot_task_readers],
+                manifest.hot_task_id,
+                requests,
+            )
+
+        if "analyze" in scenarios:
+            # Requires the server to run with MOCK_AGENTS=true, otherwise this measures the LLM provider
+            results["analyze"] = await _run_requests(
+                lambda i: client.post(f"/tasks/{task_ids[i % len(task_ids)]}/analyze", headers=owner_headers),
+                requests,
+                concurrency,
+            )
+
+    return results
@@ -0,0 +1,101 @@
+"""Latency summaries and baseline comparison."""
+
+import datetime
+import json
+import math
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+
+@dataclass
+class ScenarioResult:
+    count: int
+    errors: int
+    duration_s: float
+    rps: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies_s: list[float], errors: int, duration_s: float) -> ScenarioResult:
+    latencies_ms = [latency * 1000 for latency in latencies_s]
+    count = len(latencies_ms)
+    return ScenarioResult(
+        count=count,
+        errors=errors,
+        duration_s=round(duration_s, 4),
+        rps=round(count / duration_s, 2) if duration_s > 0 else 0.0,
+        mean_ms=round(sum(latencies_ms) / count, 3) if count else 0.0,
+        p50_ms=round(percentile(latencies_ms, 50), 3),
+        p95_ms=round(percentile(latencies_ms, 95), 3),
+        p99_ms=round(percentile(latencies_ms, 99), 3),
+    )
+
+
+def save_baseline(path: Path, params: dict, results: dict[str, ScenarioResult]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "created_at": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        "params": params,
+        "results": {name: asdict(result) for name, result in results.items()},
+    }
+    path.write_text(json.dumps(data, indent=2))
+
+
+def load_baseline(path: Path) -> dict[str, ScenarioResult]:
+    data = json.loads(path.read_text())
+    return {name: ScenarioResult(**result) for name, result in data["results"].items()}
+
+
+def compare(
+    baseline: dict[str, ScenarioResult],
+    current: dict[str, ScenarioResult],
+    tolerance: float,
+) -> list[str]:
+    """
+    Compare a run against a baseline.
+
+    Returns a human-readable description of every regression, where a regression is a p95 or p99 latency
+    increase, or a throughput decrease, of more than `tolerance` (a fraction, e.g. 0.2 for 20%).
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        for metric in ("p95_ms", "p99_ms"):
+            old, new = getattr(base, metric), getattr(result, metric)
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old:.2f} -> {new:.2f} (+{(new / old - 1) * 100:.0f}%)")
+
+        if base.rps > 0 and result.rps < base.rps * (1 - tolerance):
+            regressions.append(
+                f"{name}: rps {base.rps:.2f} -> {result.rps:.2f} (-{(1 - result.rps / base.rps) * 100:.0f}%)"
+            )
+
+        if result.errors > base.errors:
+            regressions.append(f"{name}: errors {base.errors} -> {result.errors}")
+
+    return regressions
+
+
+def format_table(results: dict[str, ScenarioResult]) -> str:
+    header = f"{'scenario':<16}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<16}{r.count:>8}{r.errors:>8}{r.rps:>10.1f}{r.p50_ms:>10.2f}{r.p95_ms:>10.2f}{r.p99_ms:>10.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,125 @@
+"""Seed a local database with benchmark users, tasks, and reader relationships."""
+
+import json
+import logging
+import random
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from passlib.context import CryptContext
+from sqlalchemy import delete, insert
+
+from app import models
+from app.db import SessionFactory
+
+logger = logging.getLogger(__name__)
+
+BENCH_EMAIL_DOMAIN = "bench.local"
+BENCH_PASSWORD = "benchmark-password"
+
+
+@dataclass
+class SeedManifest:
+    """Everything the load runner needs to know about a seeded dataset."""
+
+    users: int
+    tasks_per_user: int
+    readers_per_task: int
+    fanout_readers: int
+    password: str
+    emails: list[str] = field(default_factory=list)
+    # A task owned by the first user, shared with `fanout_readers` other users
+    hot_task_id: str = ""
+    hot_task_readers: list[str] = field(default_factory=list)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(asdict(self), indent=2))
+
+    @classmethod
+    def load(cls, path: Path) -> "SeedManifest":
+        return cls(**json.loads(path.read_text()))
+
+
+def _email(index: int) -> str:
+    return f"bench-user-{index}@{BENCH_EMAIL_DOMAIN}"
+
+
+def clear() -> None:
+    """Remove all previously seeded benchmark data (tasks and readers are removed by cascades)."""
+    with SessionFactory() as db:
+        db.execute(delete(models.User).where(models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")))
+        db.commit()
+
+
+def seed(
+    users: int,
+    tasks_per_user: int,
+    readers_per_task: int,
+    fanout_readers: int,
+    random_seed: int = 0,
+) -> SeedManifest:
+    """
+    Insert a deterministic dataset for benchmarking.
+
+    All users share a single password, so it is only hashed once.
+    """
+    if fanout_readers >= users:
+        raise ValueError("fanout_readers must be smaller than the number of users")
+
+    rng = random.Random(random_seed)
+    password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+
+    user_ids = [uuid.UUID(int=rng.getrandbits(128), version=4) for _ in range(users)]
+    user_rows = [
+        {"id": user_id, "name": f"Bench User {i}", "email": _email(i), "password_hash": password_hash}
+        for i, user_id in enumerate(user_ids)
+    ]
+
+    task_rows = []
+    reader_rows = []
+    for owner_index, owner_id in enumerate(user_ids):
+        others = user_ids[:owner_index] + user_ids[owner_index + 1 :]
+        for task_index in range(tasks_per_user):
+            task_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            task_rows.append(
+                {
+                    "id": task_id,
+                    "title": f"Task {task_index} of user {owner_index}",
+                    "description": " ".join(rng.choices(["lorem", "ipsum", "dolor", "sit", "amet"], k=40)),
+                    "priority": rng.choice(list(models.TaskPriority)),
+                    "status": rng.choice(list(models.TaskStatus)),
+                    "deadline": None,
+                    "user_id": owner_id,
+                }
+            )
+            for reader_id in rng.sample(others, min(readers_per_task, len(others))):
+                reader_rows.append({"task_id": task_id, "user_id": reader_id})
+
+    # The hot task is the first task of the first user, shared with a fixed set of readers
+    hot_task_id = task_rows[0]["id"]
+    hot_reader_indexes = list(range(1, fanout_readers + 1))
+    existing = {r["user_id"] for r in reader_rows if r["task_id"] == hot_task_id}
+    for index in hot_reader_indexes:
+        if user_ids[index] not in existing:
+            reader_rows.append({"task_id": hot_task_id, "user_id": user_ids[index]})
+
+    with SessionFactory() as db:
+        db.execute(insert(models.User), user_rows)
+        db.execute(insert(models.Task), task_rows)
+        if reader_rows:
+            db.execute(insert(models.TaskReaders), reader_rows)
+        db.commit()
+
+    logger.info(f"Seeded {len(user_rows)} users, {len(task_rows)} tasks, and {len(reader_rows)} reader relationships")
+    return SeedManifest(
+        users=users,
+        tasks_per_user=tasks_per_user,
+        readers_per_task=readers_per_task,
+        fanout_readers=fanout_readers,
+        password=BENCH_PASSWORD,
+        emails=[row["email"] for row in user_rows],
+        hot_task_id=str(hot_task_id),
+        hot_task_readers=[_email(i) for i in hot_reader_indexes],
+    )
@@ -0,0 +1,68 @@
+"""Compare FastAPI's default response serialization with `SchemaResponse` on a task listing."""
+
+import asyncio
+import datetime
+import time
+import uuid
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.models import TaskPriority, TaskStatus
+from app.responses import SchemaResponse
+from app.schemas.tasks import TaskSummary
+from benchmarks.results import ScenarioResult, summarize
+
+
+def _listing(size: int) -> list[TaskSummary]:
+    owner = SimpleNamespace(name="Bench User", email="bench-user@bench.local")
+    deadline = datetime.datetime.now(tz=datetime.timezone.utc)
+    return [
+        TaskSummary.from_db(
+            SimpleNamespace(
+                id=uuid.uuid4(),
+                title=f"Task {i}",
+                priority=TaskPriority.medium,
+                status=TaskStatus.pending,
+                deadline=deadline,
+                user_id=uuid.uuid4(),
+                user=owner,
+            )
+        )
+        for i in range(size)
+    ]
+
+
+def _time(fn, iterations: int) -> ScenarioResult:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, errors=0, duration_s=time.perf_counter() - start)
+
+
+def run(size: int = 100, iterations: int = 2000) -> dict[str, ScenarioResult]:
+    items = _listing(size)
+    field = create_model_field(name="Response_list_tasks", type_=list[TaskSummary], mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def default_path() -> bytes:
+        # Mirrors what FastAPI does for a route with `response_model=list[TaskSummary]`
+        content = loop.run_until_complete(serialize_response(field=field, response_content=items))
+        return JSONResponse(content).body
+
+    def fast_path() -> bytes:
+        return SchemaResponse(items).body
+
+    try:
+        assert default_path() == fast_path(), "Both paths must produce identical bodies"
+        return {
+            f"default_{size}": _time(default_path, iterations),
+            f"schema_{size}": _time(fast_path, iterations),
+        }
+    finally:
+        loop.close()
@@ -0,0 +1,2 @@
+-- Modify "tasks" table
+ALTER TABLE "public"."tasks" ADD COLUMN "version" integer NOT NULL DEFAULT 1;
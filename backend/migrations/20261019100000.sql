@@ -0,0 +1,38 @@
+-- Move the existing "agent_responses" table out of the way
+ALTER TABLE "public"."agent_responses" RENAME TO "agent_responses_unpartitioned";
+ALTER INDEX "public"."agent_responses_pkey" RENAME TO "agent_responses_unpartitioned_pkey";
+DROP INDEX "public"."ix_agent_responses_id";
+-- Create "agent_responses" table, partitioned by month
+CREATE TABLE "public"."agent_responses" (
+  "id" uuid NOT NULL,
+  "agent_type" "public"."agenttype" NOT NULL,
+  "response_data" text COMPRESSION lz4 NOT NULL,
+  "created_at" timestamptz NOT NULL DEFAULT timezone('utc'::text, CURRENT_TIMESTAMP),
+  "task_id" uuid NOT NULL,
+  PRIMARY KEY ("id", "created_at"),
+  CONSTRAINT "agent_responses_task_id_fkey" FOREIGN KEY ("task_id") REFERENCES "public"."tasks" ("id") ON UPDATE NO ACTION ON DELETE CASCADE
+) PARTITION BY RANGE ("created_at");
+-- Create index "ix_agent_responses_task_id_created_at" to table: "agent_responses"
+CREATE INDEX "ix_agent_responses_task_id_created_at" ON "public"."agent_responses" ("task_id", "created_at");
+-- Create monthly partitions from the oldest response up to 3 months ahead, later ones are created by the retention job
+DO $$
+DECLARE
+  month timestamp := date_trunc('month', least(
+    (SELECT min("created_at") FROM "public"."agent_responses_unpartitioned"),
+    CURRENT_TIMESTAMP
+  ) AT TIME ZONE 'UTC');
+BEGIN
+  WHILE month <= date_trunc('month', CURRENT_TIMESTAMP AT TIME ZONE 'UTC') + interval '3 months' LOOP
+    EXECUTE format(
+      'CREATE TABLE "public".%I PARTITION OF "public"."agent_responses" FOR VALUES FROM (%L) TO (%L)',
+      'agent_responses_' || to_char(month, 'YYYY_MM'),
+      to_char(month, 'YYYY-MM-DD "00:00:00+00"'),
+      to_char(month + interval '1 month', 'YYYY-MM-DD "00:00:00+00"')
+    );
+    month := month + interval '1 month';
+  END LOOP;
+END $$;
+-- Copy existing responses, compressing them, and drop the old table
+INSERT INTO "public"."agent_responses" ("id", "agent_type", "response_data", "created_at", "task_id")
+SELECT "id", "agent_type", "response_data", "created_at", "task_id" FROM "public"."agent_responses_unpartitioned";
+DROP TABLE "public"."agent_responses_unpartitioned";
@@ -0,0 +1,8 @@
+-- Drop index "ix_users_id" from table: "users"
+DROP INDEX "public"."ix_users_id";
+-- Drop index "ix_tasks_id" from table: "tasks"
+DROP INDEX "public"."ix_tasks_id";
+-- Create index "ix_tasks_user_id_created_at" to table: "tasks"
+CREATE INDEX "ix_tasks_user_id_created_at" ON "public"."tasks" ("user_id", "created_at");
+-- Create index "ix_task_readers_user_id" to table: "task_readers"
+CREATE INDEX "ix_task_readers_user_id" ON "public"."task_readers" ("user_id");
@@ -0,0 +1,2 @@
+-- Create index "ix_tasks_deadline_id" to table: "tasks"
+CREATE INDEX "ix_tasks_deadline_id" ON "public"."tasks" ("deadline", "id") WHERE (status <> 'completed'::public.taskstatus);
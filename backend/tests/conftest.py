@@ -0,0 +1,52 @@
+import uuid
+from typing import Callable, Iterator
+
+import pytest
+from sqlalchemy import delete, inspect
+from sqlalchemy.exc import OperationalError
+
+from app import models
+from app.auth import generate_token
+from app.config import get_settings
+from app.db import SessionFactory, engine
+
+settings = get_settings()
+
+
+@pytest.fixture(scope="session")
+def database() -> None:
+    """Skip tests needing a migrated database when there's none, as in CI's lint job."""
+    try:
+        with engine.connect() as conn:
+            migrated = inspect(conn).has_table(models.User.__tablename__)
+    except OperationalError:
+        pytest.skip("Database unavailable")
+    if not migrated:
+        pytest.skip("Database not migrated")
+
+
+@pytest.fixture
+def make_user(database) -> Iterator[Callable[..., tuple[models.User, dict]]]:
+    """Create users for a test, returning each with its authorization headers. They are deleted afterwards."""
+    created = []
+
+    def make(is_admin: bool = False) -> tuple[models.User, dict]:
+        with SessionFactory() as db:
+            user = models.User(
+                name="Test User",
+                email=f"test-{uuid.uuid4().hex}@test.local",
+                password_hash="!",
+                is_admin=is_admin,
+            )
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+            db.expunge(user)
+        created.append(user.id)
+        token = generate_token(settings.JWT_DURATION, user.email, "access")
+        return user, {"Authorization": f"Bearer {token}"}
+
+    yield make
+    with SessionFactory() as db:
+        db.execute(delete(models.User).where(models.User.id.in_(created)))
+        db.commit()
@@ -0,0 +1,87 @@
+import uuid
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from app import admission
+from app.admission import (
+    AdmissionPolicy,
+    ConcurrencyLimiter,
+    RateLimiter,
+    admit,
+    admit_user,
+)
+from app.auth import _require_user
+from app.config import AdmissionLimit
+
+
+def test_rate_limiter_bursts_then_limits():
+    limiter = RateLimiter(rate_per_minute=60, burst=3, max_keys=10)
+    assert [limiter.take("a") for _ in range(3)] == [0, 0, 0]
+    assert 0 < limiter.take("a") <= 1
+    # Other keys have their own bucket
+    assert limiter.take("b") == 0
+
+
+def test_rate_limiter_bounds_keys():
+    limiter = RateLimiter(rate_per_minute=60, burst=1, max_keys=2)
+    for key in "abc":
+        limiter.take(key)
+    # The least recently used bucket was dropped, so "a" starts with a full bucket again
+    assert limiter.take("a") == 0
+
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(limit=1)
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def admission_app(monkeypatch, limits: AdmissionLimit) -> tuple[TestClient, uuid.UUID]:
+    monkeypatch.setattr(admission.settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setitem(admission.policies, "default", AdmissionPolicy(limits, max_keys=10))
+    user_id = uuid.uuid4()
+    app = FastAPI()
+    app.dependency_overrides[_require_user] = lambda: SimpleNamespace(id=user_id)
+    app.get("/anonymous", dependencies=[admit("default")])(lambda: {})
+    app.get("/user", dependencies=[admit_user("default")])(lambda: {})
+    # As uvicorn does with --proxy-headers, for the test client's host
+    return TestClient(ProxyHeadersMiddleware(app, trusted_hosts="testclient")), user_id
+
+
+def test_clients_behind_the_proxy_have_their_own_limits(monkeypatch):
+    limits = AdmissionLimit(user_rate_per_minute=60, ip_rate_per_minute=1, burst=1, concurrency=10)
+    client, _ = admission_app(monkeypatch, limits)
+
+    first, second = {"X-Forwarded-For": "203.0.113.1"}, {"X-Forwarded-For": "203.0.113.2"}
+    assert client.get("/anonymous", headers=first).status_code == 200
+    res = client.get("/anonymous", headers=first)
+    assert res.status_code == 429 and int(res.headers["Retry-After"]) > 0
+    assert client.get("/anonymous", headers=second).status_code == 200
+
+
+def test_rate_limited_users_dont_spend_ip_tokens(monkeypatch):
+    limits = AdmissionLimit(user_rate_per_minute=1, ip_rate_per_minute=1, burst=2, concurrency=10)
+    client, user_id = admission_app(monkeypatch, limits)
+    policy = admission.policies["default"]
+    policy.per_user = RateLimiter(rate_per_minute=1, burst=1, max_keys=10)
+    headers = {"X-Forwarded-For": "203.0.113.1"}
+
+    assert [client.get("/user", headers=headers).status_code for _ in range(2)] == [200, 429]
+    # The user was limited before the address, which has a token left for others
+    assert policy.per_ip.take("203.0.113.1") == 0
+    assert policy.per_ip.take("203.0.113.1") > 0
+
+
+def test_users_rejected_by_ip_keep_their_tokens(monkeypatch):
+    limits = AdmissionLimit(user_rate_per_minute=1, ip_rate_per_minute=1, burst=1, concurrency=10)
+    client, user_id = admission_app(monkeypatch, limits)
+    headers = {"X-Forwarded-For": "203.0.113.1"}
+
+    assert client.get("/anonymous", headers=headers).status_code == 200
+    assert client.get("/user", headers=headers).status_code == 429
+    assert admission.policies["default"].per_user.take(str(user_id)) == 0
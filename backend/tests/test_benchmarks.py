@@ -0,0 +1,25 @@
+from benchmarks import broadcast
+from benchmarks.results import compare, percentile, summarize
+
+
+def test_percentile():
+    samples = [float(i) for i in range(1, 101)]
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([], 50) == 0
+
+
+def test_compare_flags_regressions():
+    baseline = {"list_tasks": summarize([0.01] * 100, errors=0, duration_s=1)}
+    same = {"list_tasks": summarize([0.01] * 100, errors=0, duration_s=1)}
+    slower = {"list_tasks": summarize([0.02] * 100, errors=0, duration_s=2)}
+
+    assert compare(baseline, same, tolerance=0.2) == []
+    assert len(compare(baseline, slower, tolerance=0.2)) == 3
+
+
+def test_broadcast_modes():
+    results = broadcast.run(events=20, sockets=3, readers=5)
+    assert set(results) == set(broadcast.MODES)
+    assert results["msgpack"].bytes_per_event < results["json"].bytes_per_event
+    assert results["json+deflate"].bytes_per_event < results["json"].bytes_per_event
@@ -0,0 +1,80 @@
+import uuid
+
+from app.cache import PageCache, UserCache
+
+
+def test_user_cache_eviction_and_invalidation():
+    cache: UserCache[int] = UserCache(max_users=2, ttl=60)
+    first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+    cache.set(first, 1, cache.version)
+    cache.set(second, 2, cache.version)
+    cache.set(third, 3, cache.version)
+    assert cache.get(first) is None
+    assert cache.get(second) == 2
+
+    cache.invalidate({second})
+    assert cache.get(second) is None
+    assert cache.get(third) == 3
+
+
+def test_user_cache_expiry():
+    cache: UserCache[int] = UserCache(max_users=2, ttl=-1)
+    user = uuid.uuid4()
+    cache.set(user, 1, cache.version)
+    assert cache.get(user) is None
+
+
+def test_user_cache_discards_values_read_before_invalidation():
+    cache: UserCache[int] = UserCache(max_users=1, ttl=60)
+    user, other = uuid.uuid4(), uuid.uuid4()
+
+    version = cache.version
+    cache.invalidate({user})
+    cache.set(user, 1, version)
+    assert cache.get(user) is None
+
+    # Evicts the invalidation of the first user, which still discards values read before it
+    cache.invalidate({other})
+    cache.set(user, 1, version)
+    assert cache.get(user) is None
+    cache.set(user, 2, cache.version)
+    assert cache.get(user) == 2
+
+
+def test_page_cache_discards_pages_read_before_invalidation():
+    cache = PageCache(max_pages=10, ttl=60)
+    user, other = uuid.uuid4(), uuid.uuid4()
+
+    version = cache.version
+    cache.set(user, (0, 50), version, b"[1]")
+    cache.set(other, (0, 50), version, b"[2]")
+    assert cache.get(user, (0, 50)) == b"[1]"
+    assert cache.get(user, (50, 50)) is None
+
+    # Read before the invalidation, stored after it
+    version = cache.version
+    cache.invalidate({user})
+    cache.set(user, (0, 50), version, b"[stale]")
+    assert cache.get(user, (0, 50)) is None
+    assert cache.get(other, (0, 50)) == b"[2]"
+
+    cache.set(user, (0, 50), cache.version, b"[3]")
+    assert cache.get(user, (0, 50)) == b"[3]"
+    assert cache.stats() == {"pages": 2, "hits": 3, "misses": 2, "hit_rate": 0.6}
+
+
+def test_page_cache_evicted_versions_invalidate_older_pages():
+    cache = PageCache(max_pages=1, ttl=60)
+    first, second = uuid.uuid4(), uuid.uuid4()
+
+    version = cache.version
+    cache.invalidate({first})
+    # Evicts the version of the first user
+    cache.invalidate({second})
+    cache.set(first, "page", version, b"[stale]")
+    assert cache.get(first, "page") is None
+
+    cache.clear()
+    cache.set(first, "page", cache.version, b"[1]")
+    assert cache.get(first, "page") == b"[1]"
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from starlette.requests import HTTPConnection
+
+from app.db import _get_session, engine, read_engine
+
+
+def test_only_reads_get_read_only_sessions():
+    for method, bind in (("GET", read_engine), ("HEAD", read_engine), ("POST", engine), ("PUT", engine)):
+        sessions = _get_session(HTTPConnection({"type": "http", "method": method}))
+        assert next(sessions).get_bind() is bind
+        sessions.close()
+
+    sessions = _get_session(HTTPConnection({"type": "websocket"}))
+    assert next(sessions).get_bind() is engine
+    sessions.close()
+
+
+def test_read_sessions_are_read_only(database):
+    sessions = _get_session(HTTPConnection({"type": "http", "method": "GET"}))
+    db = next(sessions)
+    setting = "SELECT current_setting('transaction_read_only'), current_setting('transaction_isolation')"
+    # Read committed, so statements see writes committed since the request's first one
+    assert db.execute(text(setting)).one() == ("on", "read committed")
+    with pytest.raises(DBAPIError):
+        db.execute(text("CREATE TEMPORARY TABLE not_allowed (id int)"))
+    sessions.close()
+
+    # Connections go back to the pool in their default mode
+    assert read_engine.pool is engine.pool
+    with engine.connect() as connection:
+        assert connection.execute(text(setting)).one() == ("off", "read committed")
@@ -1,6 +1,10 @@
+import asyncio
+
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.services import retention
+from app.warmup import WarmUp
 
 
 def test_health():
@@ -8,3 +12,23 @@ def test_health():
     res = client.get("/health")
     assert res.status_code == 200
     assert res.json() == {"status": "ok"}
+
+
+def test_not_ready_before_warm_up():
+    # Without entering the client's context, the lifespan and its warm-up never run
+    client = TestClient(app)
+    res = client.get("/ready")
+    assert res.status_code == 503
+    assert res.json()["status"] == "warming"
+
+
+def test_partition_failures_dont_hold_readiness(database, monkeypatch, caplog):
+    def fail(drop_expired: bool) -> None:
+        raise RuntimeError("lock timeout")
+
+    monkeypatch.setattr(retention, "run", fail)
+    warm_up = WarmUp(connections=1)
+    asyncio.run(asyncio.wait_for(warm_up.run_until_ready(retry_interval=0), timeout=30))
+    assert warm_up.report()["status"] == "ready"
+    assert warm_up.attempts == 1
+    assert "Could not create agent response partitions" in caplog.text
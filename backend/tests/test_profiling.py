@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import profiling
+from app.profiling import (
+    PROFILE_ID_HEADER,
+    PROFILE_SKIPPED_HEADER,
+    Profile,
+    ProfileStore,
+    ProfilingMiddleware,
+)
+
+
+def busy_endpoint() -> dict:
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return {"status": "ok"}
+
+
+def test_sampled_requests_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", ProfileStore(tmp_path, max_profiles=10))
+    app = FastAPI()
+    app.get("/busy")(busy_endpoint)
+    app.add_middleware(ProfilingMiddleware, sample_rate=1)
+
+    res = TestClient(app).get("/busy")
+    assert res.status_code == 200
+
+    profile = profiling.profiles.get(res.headers[PROFILE_ID_HEADER])
+    assert (profile.path, profile.status, profile.requested) == ("/busy", 200, False)
+    assert [query.statement for query in profile.queries] == ["SELECT 1"]
+    # The endpoint runs in a worker thread, busy for most of the request
+    assert profile.samples > 0
+    assert f"{__name__}:busy_endpoint" in {function["function"] for function in profile.functions}
+
+
+def test_unrequested_requests_are_not_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", ProfileStore(tmp_path, max_profiles=10))
+    app = FastAPI()
+    app.get("/busy")(busy_endpoint)
+    app.add_middleware(ProfilingMiddleware, sample_rate=0)
+
+    # Not an admin, so the flag is ignored
+    res = TestClient(app).get("/busy", headers={"X-Profile": "1", "Authorization": "Bearer invalid"})
+    assert PROFILE_ID_HEADER not in res.headers
+    assert profiling.profiles.summaries() == []
+
+
+def test_store_keeps_most_recent_profiles(tmp_path):
+    store = ProfileStore(tmp_path, max_profiles=2)
+    ids = []
+    for i in range(3):
+        profile = Profile(id=f"{i:032x}", method="GET", path=f"/{i}", requested=True, started_at="")
+        store.save(profile)
+        ids.append(profile.id)
+        time.sleep(0.01)
+
+    assert [summary["path"] for summary in store.summaries()] == ["/2", "/1"]
+    assert store.get(ids[0]) is None
+    assert store.get("../not-a-profile") is None
+
+
+def test_admins_request_profiles(make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", ProfileStore(tmp_path, max_profiles=10))
+    app = FastAPI()
+    app.get("/busy")(busy_endpoint)
+    app.add_middleware(ProfilingMiddleware, sample_rate=0)
+    _, headers = make_user(is_admin=True)
+
+    res = TestClient(app).get("/busy", headers=headers | {"X-Profile": "1"})
+    assert profiling.profiles.get(res.headers[PROFILE_ID_HEADER]).requested
+
+
+def test_requested_profiles_wait_for_the_profile_in_progress(make_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "profiles", ProfileStore(tmp_path, max_profiles=10))
+    monkeypatch.setattr(profiling, "REQUESTED_PROFILE_WAIT", 0.01)
+    app = FastAPI()
+    app.get("/busy")(busy_endpoint)
+    middleware = ProfilingMiddleware(app, sample_rate=0)
+    client = TestClient(middleware)
+    _, headers = make_user(is_admin=True)
+    headers |= {"X-Profile": "1"}
+
+    # Another request is being profiled past the wait
+    asyncio.run(middleware._lock.acquire())
+    res = client.get("/busy", headers=headers)
+    assert res.status_code == 200
+    assert res.headers[PROFILE_SKIPPED_HEADER] == "busy"
+    assert PROFILE_ID_HEADER not in res.headers
+
+    middleware._lock.release()
+    res = client.get("/busy", headers=headers)
+    assert PROFILE_SKIPPED_HEADER not in res.headers
+    assert profiling.profiles.get(res.headers[PROFILE_ID_HEADER]).requested
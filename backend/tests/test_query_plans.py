@@ -0,0 +1,116 @@
+"""
+Query plan regression tests for the hot queries.
+
+Plans are read with EXPLAIN from the database in DATABASE_URL (seed it with `python -m benchmarks seed` for
+realistic statistics). Sequential scans are disabled while planning, so one showing up in a plan, or an index
+scan not constraining the index's leading column, means no index can serve the query. The tests are skipped when
+the database is unavailable or not migrated.
+"""
+
+import datetime
+import re
+import uuid
+from typing import Iterator
+
+import pytest
+from sqlalchemy import Connection, Select, func, inspect, select
+from sqlalchemy.exc import OperationalError
+
+from app import models
+from app.db import engine
+from app.reminders import Window, due_tasks_query
+
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+@pytest.fixture(scope="module")
+def connection() -> Iterator[Connection]:
+    try:
+        conn = engine.connect()
+    except OperationalError:
+        pytest.skip("Database unavailable")
+
+    with conn:
+        if not inspect(conn).has_table(models.Task.__tablename__):
+            pytest.skip("Database not migrated")
+        # Only lasts for the current transaction, which is never committed
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        yield conn
+        conn.rollback()
+
+
+def leading_columns(connection: Connection) -> dict[str, str]:
+    query = (
+        "SELECT i.indexrelid::regclass::text, a.attname FROM pg_index i "
+        "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]"
+    )
+    return dict(connection.exec_driver_sql(query).all())
+
+
+def full_scans(connection: Connection, query: Select) -> list[str]:
+    """Return the relations scanned in full, sequentially or through an index, in the plan of a query."""
+    leading = leading_columns(connection)
+    compiled = query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    [plan] = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}").scalar_one()
+
+    scans, nodes = [], [plan["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append(node["Relation Name"])
+        elif node["Node Type"] in INDEX_SCANS and not re.search(
+            rf"\b{leading[node['Index Name']]}\b", node.get("Index Cond", "")
+        ):
+            # Postgres also lists conditions on later columns of an index it scans in full as index conditions
+            scans.append(node["Index Name"])
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+
+def test_list_tasks_uses_indexes(connection: Connection):
+    query = (
+        select(models.Task)
+        .where(models.Task.visible_to(uuid.uuid4()))
+        .order_by(models.Task.created_at.desc())
+        .limit(50)
+    )
+    assert full_scans(connection, query) == []
+
+
+def test_task_stats_use_indexes(connection: Connection):
+    query = (
+        select(models.Task.status, models.Task.priority, func.count())
+        .where(models.Task.visible_to(uuid.uuid4()))
+        .group_by(models.Task.status, models.Task.priority)
+    )
+    assert full_scans(connection, query) == []
+
+
+def test_task_readers_use_indexes(connection: Connection):
+    query = (
+        select(models.User.id, models.User.email)
+        .join(models.TaskReaders, models.TaskReaders.user_id == models.User.id)
+        .where(models.TaskReaders.task_id == uuid.uuid4())
+    )
+    assert full_scans(connection, query) == []
+
+
+def test_task_responses_use_indexes(connection: Connection):
+    query = (
+        select(models.AgentResponse)
+        .where(models.AgentResponse.task_id == uuid.uuid4())
+        .order_by(models.AgentResponse.created_at.desc())
+        .limit(20)
+    )
+    assert full_scans(connection, query) == []
+
+
+def test_user_lookup_uses_indexes(connection: Connection):
+    query = select(models.User).where(models.User.email == "someone@example.com")
+    assert full_scans(connection, query) == []
+
+
+def test_due_tasks_use_indexes(connection: Connection):
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    window = Window(now - datetime.timedelta(minutes=1), now, overdue=True)
+    assert full_scans(connection, due_tasks_query(window, after=(now, uuid.uuid4()))) == []
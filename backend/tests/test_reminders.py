@@ -0,0 +1,43 @@
+import datetime
+import json
+import uuid
+
+from app.reminders import ReminderScheduler, Window, by_user, payloads
+
+NOW = datetime.datetime(2026, 10, 19, 12, tzinfo=datetime.timezone.utc)
+MINUTE = datetime.timedelta(minutes=1)
+DAY = datetime.timedelta(days=1)
+
+
+def test_first_windows_cover_one_interval():
+    scheduler = ReminderScheduler(interval=MINUTE, due_soon=DAY)
+    assert scheduler.windows(NOW) == [
+        Window(NOW - MINUTE, NOW, overdue=True),
+        Window(NOW - MINUTE + DAY, NOW + DAY, overdue=False),
+    ]
+
+
+def test_windows_continue_from_last_scan():
+    scheduler = ReminderScheduler(interval=MINUTE, due_soon=DAY)
+    scheduler._last_scan = NOW - 5 * MINUTE
+    overdue, due_soon = scheduler.windows(NOW)
+    # After a missed tick, the windows stretch back to the last scan, so no deadline is skipped
+    assert (overdue.start, overdue.end) == (NOW - 5 * MINUTE, NOW)
+    assert (due_soon.start, due_soon.end) == (NOW - 5 * MINUTE + DAY, NOW + DAY)
+
+
+def test_payloads_fit_in_notifications():
+    owner, reader = uuid.uuid4(), uuid.uuid4()
+    reminders = [
+        {"task_id": str(uuid.uuid4()), "title": "Ω" * 100, "overdue": True, "user_ids": [str(owner), str(reader)]}
+        for _ in range(100)
+    ]
+    chunks = list(payloads(reminders))
+    assert len(chunks) > 1
+    assert all(len(chunk.encode()) <= 7000 for chunk in chunks)
+
+    decoded = [reminder for chunk in chunks for reminder in json.loads(chunk)]
+    assert decoded == reminders
+    tasks = by_user(decoded)
+    assert tasks.keys() == {owner, reader}
+    assert tasks[owner][0] == {key: value for key, value in reminders[0].items() if key != "user_ids"}
@@ -0,0 +1,20 @@
+import datetime
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.responses import SchemaResponse
+from app.schemas.tasks import TaskSummary
+
+
+def test_schema_response_matches_default_encoding():
+    summary = TaskSummary(
+        id=uuid.uuid4(),
+        title="Tâche",
+        priority="High",
+        status="Pending",
+        deadline=datetime.datetime.now(tz=datetime.timezone.utc),
+        user_id=uuid.uuid4(),
+    )
+    assert SchemaResponse([summary]).body == JSONResponse(jsonable_encoder([summary])).body
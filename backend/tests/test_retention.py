@@ -0,0 +1,27 @@
+import datetime
+
+from app.services.retention import (
+    add_months,
+    expired_partitions,
+    month_start,
+    partition_name,
+)
+
+UTC = datetime.timezone.utc
+
+
+def test_months_wrap_around_years():
+    month = month_start(datetime.datetime(2026, 11, 15, 12, 30, tzinfo=UTC))
+    assert month == datetime.datetime(2026, 11, 1, tzinfo=UTC)
+    assert [partition_name(add_months(month, i)) for i in range(3)] == [
+        "agent_responses_2026_11",
+        "agent_responses_2026_12",
+        "agent_responses_2027_01",
+    ]
+
+
+def test_only_whole_months_before_cutoff_expire():
+    partitions = {partition_name(month): month for month in (datetime.datetime(2026, m, 1, tzinfo=UTC) for m in (3, 4))}
+    # Responses from the start of April are still retained
+    cutoff = datetime.datetime(2026, 4, 20, tzinfo=UTC)
+    assert expired_partitions(partitions, cutoff) == ["agent_responses_2026_03"]
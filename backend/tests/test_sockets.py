@@ -0,0 +1,191 @@
+import asyncio
+import json
+import uuid
+
+import msgpack
+
+from app.notifications import IDS_PER_NOTIFICATION, MAX_PAYLOAD_SIZE
+from app.routers import sockets, tasks
+from app.routers.sockets import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.closed_reason = None
+
+    async def close(self, code: int, reason: str) -> None:
+        self.closed_reason = reason
+
+
+class RecordingWebSocket(FakeWebSocket):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self.frames = []
+
+    async def send_text(self, frame: str) -> None:
+        self.frames.append(frame)
+        self.sent.append(json.loads(frame))
+
+    async def send_bytes(self, frame: bytes) -> None:
+        self.frames.append(frame)
+        self.sent.append(msgpack.unpackb(frame))
+
+
+def test_register_evicts_oldest_connection():
+    manager = ConnectionManager(max_connections_per_user=2, idle_timeout=60)
+    user_id = uuid.uuid4()
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for ws in sockets:
+        asyncio.run(manager.register(ws, user_id))
+
+    assert sockets[0].closed_reason == "Connection limit reached"
+    assert sockets[1].closed_reason is None
+    assert manager.stats()["connections"] == 2
+    assert manager.stats()["evicted_total"] == 1
+
+
+def test_idle_detection():
+    manager = ConnectionManager(max_connections_per_user=2, idle_timeout=-1)
+    ws = FakeWebSocket()
+    asyncio.run(manager.register(ws, uuid.uuid4()))
+    assert manager.is_idle(ws)
+
+    asyncio.run(manager.reap(ws))
+    assert ws.closed_reason == "Idle timeout"
+    assert manager.stats()["connections"] == 0
+
+
+def test_topic_index_resolves_recipients():
+    manager = ConnectionManager(max_connections_per_user=2, idle_timeout=60)
+    owner_id, reader_id, task_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    owner_ws, reader_ws = FakeWebSocket(), FakeWebSocket()
+    asyncio.run(manager.register(owner_ws, owner_id))
+    asyncio.run(manager.register(reader_ws, reader_id))
+
+    manager.subscribe(owner_ws, {"mine"})
+    manager.subscribe(reader_ws, {"shared"}, shared_tasks=set())
+    assert manager._task_recipients(task_id, owner_id, set()) == {owner_ws}
+
+    manager.add_reader(task_id, reader_id)
+    assert manager._task_recipients(task_id, owner_id, {reader_id}) == {owner_ws, reader_ws}
+    # Removed by another process, whose notification didn't arrive yet
+    assert manager._task_recipients(task_id, owner_id, set()) == {owner_ws}
+
+    manager.remove_reader(task_id, reader_id)
+    assert manager._task_recipients(task_id, owner_id, {reader_id}) == {owner_ws}
+
+    manager.disconnect(owner_ws)
+    assert manager.stats()["topics"] == 0
+
+
+def test_updates_are_coalesced_within_window():
+    async def scenario() -> list[dict]:
+        manager = ConnectionManager(max_connections_per_user=2, idle_timeout=60, coalesce_window=0.05)
+        owner_id, task_id = uuid.uuid4(), uuid.uuid4()
+        ws = RecordingWebSocket()
+        await manager.register(ws, owner_id)
+        manager.subscribe(ws, {"mine"})
+
+        for payload in ("first", "second", "third"):
+            await manager.send_task_update(task_id, owner_id, (), payload)
+        await asyncio.sleep(0.15)
+
+        assert manager.stats()["frames_suppressed"] == 1
+        assert manager.stats()["coalescing_tasks"] == 0
+        return ws.sent
+
+    sent = asyncio.run(scenario())
+    assert [message["task"] for message in sent] == ["first", "third"]
+
+
+def test_deltas_are_sent_to_opted_in_sockets_and_merged():
+    def delta(base_version: int, **changes) -> dict:
+        return {"base_version": base_version, "version": base_version + 1, "changes": changes}
+
+    async def scenario() -> tuple[list[dict], list[dict]]:
+        manager = ConnectionManager(max_connections_per_user=2, idle_timeout=60, coalesce_window=0.05)
+        owner_id, task_id = uuid.uuid4(), uuid.uuid4()
+        full_ws, delta_ws = RecordingWebSocket(), RecordingWebSocket()
+        await manager.register(full_ws, owner_id)
+        await manager.register(delta_ws, owner_id, deltas=True)
+        manager.subscribe(full_ws, {"mine"})
+        manager.subscribe(delta_ws, {"mine"})
+
+        await manager.send_task_update(task_id, owner_id, (), "v2", delta(1, status="In Progress"))
+        await manager.send_task_update(task_id, owner_id, (), "v3", delta(2, title="New"))
+        await manager.send_task_update(task_id, owner_id, (), "v4", delta(3, status="Completed"))
+        await asyncio.sleep(0.15)
+        return full_ws.sent, delta_ws.sent
+
+    full, deltas = asyncio.run(scenario())
+    assert [message["task"] for message in full] == ["v2", "v4"]
+    assert [message["event"] for message in deltas] == ["task.delta", "task.delta"]
+    # The held back deltas are merged into one, spanning versions 2 to 4
+    assert (deltas[1]["base_version"], deltas[1]["version"]) == (2, 4)
+    assert deltas[1]["changes"] == {"status": "Completed", "title": "New"}
+
+
+def test_messages_are_encoded_once_per_encoding():
+    async def scenario() -> tuple[list[RecordingWebSocket], ConnectionManager]:
+        manager = ConnectionManager(max_connections_per_user=4, idle_timeout=60)
+        owner_id, task_id = uuid.uuid4(), uuid.uuid4()
+        sockets = [RecordingWebSocket() for _ in range(4)]
+        await manager.register(sockets[0], owner_id)
+        await manager.register(sockets[1], owner_id)
+        await manager.register(sockets[2], owner_id, encoding="msgpack")
+        await manager.register(sockets[3], owner_id, deltas=True, encoding="msgpack")
+        for ws in sockets:
+            manager.subscribe(ws, {"mine"})
+
+        delta = {"base_version": 1, "version": 2, "changes": {"title": "New"}}
+        await manager.send_task_update(task_id, owner_id, (), json.dumps({"title": "New", "version": 2}), delta)
+        return sockets, manager
+
+    (first, second, binary, binary_delta), manager = asyncio.run(scenario())
+    assert manager.stats()["frames_sent"] == 4
+    assert manager.stats()["frames_encoded"] == 3
+    assert first.frames[0] is second.frames[0]
+    assert isinstance(first.frames[0], str) and isinstance(binary.frames[0], bytes)
+    # MessagePack clients get the task as a map rather than a JSON string
+    assert first.sent[0]["task"] == '{"title": "New", "version": 2}'
+    assert binary.sent[0]["task"] == {"title": "New", "version": 2}
+    assert binary_delta.sent[0]["event"] == "task.delta"
+
+
+def test_reader_changes_from_other_processes(monkeypatch):
+    manager = ConnectionManager(max_connections_per_user=2, idle_timeout=60)
+    monkeypatch.setattr(sockets, "manager", manager)
+    owner_id, reader_id, task_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    reader_ws = RecordingWebSocket()
+
+    async def scenario() -> None:
+        await manager.register(reader_ws, reader_id)
+        manager.subscribe(reader_ws, {"shared"}, shared_tasks=set())
+
+        change = {"task_id": str(task_id), "added": [str(reader_id)]}
+        # Already applied by this process
+        await sockets._apply_reader_changes(json.dumps(change | {"origin": sockets._ORIGIN}))
+        assert manager._task_recipients(task_id, owner_id, {reader_id}) == set()
+        await sockets._apply_reader_changes(json.dumps(change | {"origin": "other"}))
+        assert manager._task_recipients(task_id, owner_id, {reader_id}) == {reader_ws}
+
+        change = {"origin": "other", "task_id": str(task_id), "removed": [str(reader_id)]}
+        await sockets._apply_reader_changes(json.dumps(change))
+        assert manager._task_recipients(task_id, owner_id, {reader_id}) == set()
+
+    asyncio.run(scenario())
+    assert reader_ws.sent == [{"event": "task.deleted", "task_id": str(task_id)}]
+
+
+def test_notifications_listing_ids_fit_the_payload_limit(monkeypatch):
+    payloads = []
+    monkeypatch.setattr(sockets, "notify", lambda db, channel, payload: payloads.append(payload))
+    monkeypatch.setattr(tasks, "notify", lambda db, channel, payload: payloads.append(payload))
+    user_ids = {uuid.uuid4() for _ in range(IDS_PER_NOTIFICATION * 2 + 1)}
+
+    sockets.publish_reader_changes(None, uuid.uuid4(), user_ids, user_ids)
+    assert len(payloads) == 6
+    tasks.invalidate_task_caches(None, user_ids)
+    assert len(payloads) == 9
+    assert max(len(payload.encode()) for payload in payloads) <= MAX_PAYLOAD_SIZE
@@ -0,0 +1,282 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from sqlalchemy import func, select
+
+from app import models
+from app.db import SessionFactory
+from app.main import app
+from app.routers import tasks
+from app.routers.sockets import manager
+from app.routers.tasks import (
+    _parse_if_match,
+    invalidate_task_caches,
+    task_list_cache,
+    task_stats_cache,
+    task_stats_query,
+)
+from app.schemas.tasks import TaskReadersUpdate
+
+
+@pytest.mark.parametrize(("value", "version"), [('"3"', 3), ('W/"3"', 3), (" 12 ", 12), ("*", None)])
+def test_parse_if_match(value: str, version: int | None):
+    assert _parse_if_match(value) == version
+
+
+def test_malformed_if_match_never_matches():
+    with pytest.raises(HTTPException) as error:
+        _parse_if_match('"abc"')
+    assert error.value.status_code == 412
+
+
+def test_readers_update_rejects_overlap():
+    assert TaskReadersUpdate(add=["a@example.com"], remove=["b@example.com"])
+    with pytest.raises(ValidationError):
+        TaskReadersUpdate(add=["a@example.com"], remove=["a@example.com"])
+
+
+def test_task_stats_are_cached_until_tasks_change(make_user, monkeypatch):
+    user, headers = make_user()
+    client = TestClient(app)
+
+    assert client.get("/tasks/stats", headers=headers).json()["total"] == 0
+    assert task_stats_cache.get(user.id).total == 0
+    assert client.post("/tasks/", json={"title": "One", "description": ""}, headers=headers).status_code == 201
+    assert task_stats_cache.get(user.id) is None
+
+    # The tasks change while the stats are read, e.g. a commit notified by another process
+    def query_during_change(user_id, now):
+        task_stats_cache.invalidate({user_id})
+        return task_stats_query(user_id, now)
+
+    monkeypatch.setattr(tasks, "task_stats_query", query_during_change)
+    assert client.get("/tasks/stats", headers=headers).json()["total"] == 1
+    assert task_stats_cache.get(user.id) is None
+
+    monkeypatch.undo()
+    assert client.get("/tasks/stats", headers=headers).json()["total"] == 1
+    assert task_stats_cache.get(user.id).total == 1
+
+
+def test_renaming_users_refreshes_their_own_listings(make_user):
+    user, headers = make_user()
+    _, admin_headers = make_user(is_admin=True)
+    client = TestClient(app)
+    assert client.post("/tasks/", json={"title": "One", "description": ""}, headers=headers).status_code == 201
+    assert [task["owner_name"] for task in client.get("/tasks/", headers=headers).json()] == [user.name]
+
+    assert client.put(f"/users/{user.email}", json={"name": "Renamed"}, headers=admin_headers).status_code == 200
+    assert [task["owner_name"] for task in client.get("/tasks/", headers=headers).json()] == ["Renamed"]
+
+
+def test_task_lists_read_tasks_committed_mid_request(make_user, monkeypatch):
+    user, headers = make_user()
+    client = TestClient(app)
+    get_page = task_list_cache.get
+
+    # A task is created and the caches invalidated once the request has authenticated, before it reads its page
+    def get_during_change(user_id, key):
+        with SessionFactory() as db:
+            db.add(models.Task(title="One", description="", user_id=user.id))
+            invalidate_task_caches(db, {user.id})
+            db.commit()
+        return get_page(user_id, key)
+
+    monkeypatch.setattr(task_list_cache, "get", get_during_change)
+    assert len(client.get("/tasks/", headers=headers).json()) == 1
+
+    monkeypatch.undo()
+    assert len(client.get("/tasks/", headers=headers).json()) == 1
+
+
+@pytest.fixture
+def events(monkeypatch) -> list[tuple]:
+    """Task events sent to sockets, as `(event, task id, user ids)`."""
+    sent = []
+
+    async def send_task_update(task_id, owner_id, reader_ids, payload, delta=None):
+        sent.append(("updated", task_id, {owner_id, *reader_ids}))
+
+    async def send_task_removal(user_ids, task_id):
+        sent.append(("removed", task_id, set(user_ids)))
+
+    monkeypatch.setattr(manager, "send_task_update", send_task_update)
+    monkeypatch.setattr(manager, "send_task_removal", send_task_removal)
+    return sent
+
+
+def create_task(client: TestClient, headers: dict, title: str = "One") -> dict:
+    res = client.post("/tasks/", json={"title": title, "description": ""}, headers=headers)
+    assert res.status_code == 201
+    return res.json()
+
+
+def test_updates_matching_if_match_bump_the_version(make_user, events):
+    user, headers = make_user()
+    client = TestClient(app)
+    task = create_task(client, headers)
+
+    res = client.put(
+        f"/tasks/{task['id']}", json={"title": "Two"}, headers=headers | {"If-Match": f'"{task["version"]}"'}
+    )
+    assert res.status_code == 200
+    assert (res.json()["title"], res.json()["version"]) == ("Two", task["version"] + 1)
+    assert res.headers["ETag"] == f'"{task["version"] + 1}"'
+    assert events == [("updated", uuid.UUID(task["id"]), {user.id})]
+
+
+def test_updates_with_a_stale_if_match_fail(make_user, events):
+    _, headers = make_user()
+    client = TestClient(app)
+    task = create_task(client, headers)
+    updated = client.put(f"/tasks/{task['id']}", json={"title": "Two"}, headers=headers).json()
+    events.clear()
+
+    res = client.put(
+        f"/tasks/{task['id']}", json={"title": "Three"}, headers=headers | {"If-Match": f'"{task["version"]}"'}
+    )
+    assert res.status_code == 412
+    assert res.headers["ETag"] == f'"{updated["version"]}"'
+    assert client.get(f"/tasks/{task['id']}", headers=headers).json() == updated
+    assert events == []
+
+
+def test_updates_changing_nothing_are_not_written(make_user, events):
+    _, headers = make_user()
+    client = TestClient(app)
+    task = create_task(client, headers)
+
+    res = client.put(f"/tasks/{task['id']}", json={"title": task["title"], "version": task["version"]}, headers=headers)
+    assert res.status_code == 200
+    assert res.json() == task
+    assert client.get(f"/tasks/{task['id']}", headers=headers).json() == task
+    assert events == []
+
+
+@pytest.fixture
+def reader_changes(monkeypatch) -> list[tuple]:
+    """Reader changes published to other processes, as `(task id, added, removed)`."""
+    published = []
+    monkeypatch.setattr(tasks, "publish_reader_changes", lambda db, *change: published.append(change))
+    return published
+
+
+def reader_ids(task_id: str) -> set[uuid.UUID]:
+    with SessionFactory() as db:
+        query = select(models.TaskReaders.user_id).where(models.TaskReaders.task_id == uuid.UUID(task_id))
+        return set(db.execute(query).scalars())
+
+
+def test_readers_are_added_and_removed_at_once(make_user, events, reader_changes):
+    owner, headers = make_user()
+    first, _ = make_user()
+    second, _ = make_user()
+    client = TestClient(app)
+    task = create_task(client, headers)
+    task_id = uuid.UUID(task["id"])
+
+    res = client.patch(f"/tasks/{task_id}/readers", json={"add": [first.email, second.email]}, headers=headers)
+    assert sorted(res.json()["reader_emails"]) == sorted([first.email, second.email])
+    assert reader_ids(task["id"]) == {first.id, second.id}
+    assert events == [("updated", task_id, {owner.id, first.id, second.id})]
+    assert reader_changes == [(task_id, {first.id, second.id}, set())]
+    events.clear()
+    reader_changes.clear()
+
+    # Adding an existing reader changes nothing
+    res = client.patch(
+        f"/tasks/{task_id}/readers", json={"add": [second.email], "remove": [first.email]}, headers=headers
+    )
+    assert res.json()["reader_emails"] == [second.email]
+    assert reader_ids(task["id"]) == {second.id}
+    assert events == [("updated", task_id, {owner.id, second.id}), ("removed", task_id, {first.id})]
+    assert reader_changes == [(task_id, set(), {first.id})]
+    events.clear()
+    reader_changes.clear()
+
+    res = client.patch(f"/tasks/{task_id}/readers", json={"add": [second.email]}, headers=headers)
+    assert res.json()["reader_emails"] == [second.email]
+    assert (events, reader_changes) == ([], [])
+
+
+def test_readers_must_be_known_users(make_user, events, reader_changes):
+    _, headers = make_user()
+    reader, _ = make_user()
+    client = TestClient(app)
+    task = create_task(client, headers)
+
+    unknown = f"unknown-{uuid.uuid4().hex}@test.local"
+    res = client.patch(f"/tasks/{task['id']}/readers", json={"add": [reader.email, unknown]}, headers=headers)
+    assert res.status_code == 404
+    assert unknown in res.json()["detail"]
+    assert reader_ids(task["id"]) == set()
+    assert (events, reader_changes) == ([], [])
+
+
+def test_readers_subscribe_and_unsubscribe(make_user, events, reader_changes):
+    _, headers = make_user()
+    first, first_headers = make_user()
+    second, _ = make_user()
+    client = TestClient(app)
+    task = create_task(client, headers)
+
+    for reader in (first, second):
+        res = client.post(f"/tasks/subscribe/{task['id']}/{reader.email}", headers=headers)
+        assert res.status_code == 200
+    assert reader_ids(task["id"]) == {first.id, second.id}
+
+    # Readers may only remove themselves
+    assert client.delete(f"/tasks/subscribe/{task['id']}/{second.email}", headers=first_headers).status_code == 400
+    assert client.delete(f"/tasks/subscribe/{task['id']}/{first.email}", headers=first_headers).status_code == 200
+    assert reader_ids(task["id"]) == {second.id}
+    assert reader_changes[-1] == (uuid.UUID(task["id"]), set(), {first.id})
+    assert events[-1] == ("removed", uuid.UUID(task["id"]), {first.id})
+
+
+def count_rows(model, *where) -> int:
+    with SessionFactory() as db:
+        return db.execute(select(func.count()).select_from(model).where(*where)).scalar_one()
+
+
+def shared_task_with_response(client: TestClient, headers: dict, reader: models.User) -> uuid.UUID:
+    task_id = uuid.UUID(create_task(client, headers)["id"])
+    assert client.post(f"/tasks/subscribe/{task_id}/{reader.email}", headers=headers).status_code == 200
+    with SessionFactory() as db:
+        db.add(models.AgentResponse(agent_type=models.AgentType.analyzer, response_data="{}", task_id=task_id))
+        db.commit()
+    return task_id
+
+
+def test_deleting_tasks_deletes_their_responses_and_readers(make_user, events):
+    _, headers = make_user()
+    reader, _ = make_user()
+    client = TestClient(app)
+    task_id = shared_task_with_response(client, headers, reader)
+    assert count_rows(models.AgentResponse, models.AgentResponse.task_id == task_id) == 1
+    assert count_rows(models.TaskReaders, models.TaskReaders.task_id == task_id) == 1
+
+    assert client.delete(f"/tasks/{task_id}", headers=headers).status_code == 204
+    assert count_rows(models.Task, models.Task.id == task_id) == 0
+    assert count_rows(models.AgentResponse, models.AgentResponse.task_id == task_id) == 0
+    assert count_rows(models.TaskReaders, models.TaskReaders.task_id == task_id) == 0
+
+
+def test_deleting_users_deletes_their_tasks(make_user, events):
+    user, headers = make_user()
+    reader, _ = make_user()
+    _, admin_headers = make_user(is_admin=True)
+    client = TestClient(app)
+    task_id = shared_task_with_response(client, headers, reader)
+    create_task(client, headers, title="Two")
+    assert count_rows(models.Task, models.Task.user_id == user.id) == 2
+
+    assert client.delete(f"/users/{user.email}", headers=admin_headers).status_code == 204
+    assert count_rows(models.User, models.User.id == user.id) == 0
+    assert count_rows(models.Task, models.Task.user_id == user.id) == 0
+    assert count_rows(models.AgentResponse, models.AgentResponse.task_id == task_id) == 0
+    assert count_rows(models.TaskReaders, models.TaskReaders.task_id == task_id) == 0
+    # Only the user's own rows go
+    assert count_rows(models.User, models.User.id == reader.id) == 1
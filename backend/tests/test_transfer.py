@@ -0,0 +1,104 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import TaskPriority, TaskStatus
+from app.routers import tasks
+from app.schemas.tasks import TaskCreate
+from app.services.transfer import MAX_RECORD_LENGTH, ImportParser, ImportTooLarge
+
+
+def parse(fmt: str, body: bytes, chunk_size: int) -> list:
+    parser = ImportParser(fmt)
+    records = []
+    for start in range(0, len(body), chunk_size):
+        records.extend(parser.feed(body[start : start + chunk_size]))
+    return records + parser.close()
+
+
+def test_ndjson_records_split_across_chunks():
+    body = '{"title": "Café", "description": ""}\n\n{"title": "Two"}\nnot json'.encode()
+    for chunk_size in (1, 3, len(body)):
+        records = parse("ndjson", body, chunk_size)
+        assert [line for line, _ in records] == [1, 3, 4]
+        assert records[0][1] == TaskCreate(title="Café", description="")
+        assert isinstance(records[1][1], str) and isinstance(records[2][1], str)
+
+
+def test_csv_records_with_quoted_newlines():
+    body = (
+        "\ufeffid,title,description,priority,status,deadline\r\n"
+        '1,First,"Spans\r\n""two"" lines",High,Completed,\r\n'
+        "2,Second,,,,2030-01-01T00:00:00Z\r\n"
+        "3,Short\r\n"
+    ).encode()
+    for chunk_size in (1, 5, len(body)):
+        records = parse("csv", body, chunk_size)
+        assert [line for line, _ in records] == [2, 4, 5]
+        first, second, short = (task for _, task in records)
+        assert first.description == 'Spans\r\n"two" lines'
+        assert (first.priority, first.status) == (TaskPriority.high, TaskStatus.completed)
+        assert (second.description, second.priority, second.deadline.year) == ("", TaskPriority.medium, 2030)
+        assert short == "Expected 6 fields, got 2"
+
+
+def test_unterminated_csv_record():
+    assert parse("csv", b'title,description\nOpen,"never closed\n', 4) == [(2, "Unterminated quoted field")]
+
+
+def test_oversized_records_and_uploads_are_rejected():
+    parser = ImportParser("csv", max_record_length=20)
+    parser.feed(b'title,description\nOpen,"')
+    with pytest.raises(ImportTooLarge, match="Line 2"):
+        # A quoted field left open keeps its record growing
+        for _ in range(10):
+            parser.feed(b"more\n")
+
+    with pytest.raises(ImportTooLarge, match="Line 1"):
+        # A line without its end keeps the buffer growing
+        ImportParser("ndjson", max_record_length=20).feed(b'{"title": "' + b"x" * 20)
+
+    parser = ImportParser("ndjson", max_bytes=30)
+    assert parser.feed(b'{"title": "One"}\n') != []
+    with pytest.raises(ImportTooLarge, match="30 bytes"):
+        parser.feed(b'{"title": "Two"}\n')
+
+
+def test_imports_are_loaded(make_user):
+    user, headers = make_user()
+    client = TestClient(app)
+    body = (
+        '{"title": "One", "description": ""}\n{"title": ""}\n{"title": "Two", "description": "", "priority": "High"}\n'
+    )
+
+    res = client.post("/tasks/import", content=body.encode(), headers=headers)
+    assert res.status_code == 200
+    assert (res.json()["imported"], res.json()["failed"]) == (2, 1)
+    assert [error["line"] for error in res.json()["errors"]] == [2]
+    tasks = client.get("/tasks/", headers=headers).json()
+    assert sorted((task["title"], task["priority"]) for task in tasks) == [("One", "Medium"), ("Two", "High")]
+    assert {task["user_id"] for task in tasks} == {str(user.id)}
+
+
+def test_oversized_imports_are_rejected(make_user, monkeypatch):
+    _, headers = make_user()
+    client = TestClient(app)
+    row = b'{"title": "One", "description": ""}\n'
+
+    monkeypatch.setattr(tasks.settings, "TASK_IMPORT_MAX_ROWS", 2)
+    res = client.post("/tasks/import", content=row * 3, headers=headers)
+    assert res.status_code == 413
+    assert "2 tasks" in res.json()["detail"]
+
+    monkeypatch.setattr(tasks.settings, "TASK_IMPORT_MAX_BYTES", len(row) * 2)
+    res = client.post("/tasks/import", content=row * 3, headers=headers)
+    assert res.status_code == 413
+    assert "bytes" in res.json()["detail"]
+
+    monkeypatch.undo()
+    res = client.post("/tasks/import", content=b'{"title": "' + b"x" * MAX_RECORD_LENGTH + b'"}\n', headers=headers)
+    assert res.status_code == 413
+    assert "characters" in res.json()["detail"]
+
+    # Nothing of the rejected imports is kept
+    assert client.get("/tasks/", headers=headers).json() == []
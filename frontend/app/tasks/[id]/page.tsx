@@ -1,5 +1,5 @@
 "use client";
-import {useEffect, useState} from "react";
+import {useCallback, useEffect, useRef, useState} from "react";
 import {useParams, useRouter} from "next/navigation";
 import Link from "next/link";
 import {Tasks} from "@/lib/api";
@@ -13,7 +13,7 @@ import {useTaskWebSocket} from "@/lib/useWebSocket";
 
 type ReaderProps = {
     id: string
-    setTask: (task: Task | null) => void
+    setTask: (task: Task) => void
 }
 
 function AddReaderBar({id, setTask}: ReaderProps) {
@@ -47,9 +47,20 @@ export default function TaskDetailPage() {
     const [saving, setSaving] = useState(false);
     const [showDeleteConfirm, setShowDeleteConfirm] = useState(false);
     const [tasksList, setTasksList] = useState<TaskSummary[]>([]);
+    // Bumped when the task changes elsewhere, to reset the form to it
+    const [revision, setRevision] = useState(0);
+    // The version of the latest task we know of, which saves must send, and the saves queued meanwhile
+    const versionRef = useRef<number | undefined>(undefined);
+    const saveQueue = useRef<Promise<void>>(Promise.resolve());
+    const pendingSaves = useRef(0);
 
     const {user} = useAuth();
 
+    const applyTask = useCallback((updated: Task) => {
+        versionRef.current = updated.version;
+        setTask(updated);
+    }, []);
+
     useEffect(() => {
         if (!hasHydrated) return;
         if (!accessToken) {
@@ -58,7 +69,7 @@ export default function TaskDetailPage() {
         }
         // Load task details
         Tasks.get(id)
-            .then(setTask)
+            .then(applyTask)
             .catch(() => toast.error("Failed to load task"))
             .finally(() => setLoading(false));
 
@@ -68,7 +79,7 @@ export default function TaskDetailPage() {
             .catch(() => {
                 // non-blocking sidebar error
             });
-    }, [id, accessToken, hasHydrated, router]);
+    }, [id, accessToken, hasHydrated, router, applyTask]);
 
     useTaskWebSocket((msg) => {
         if (msg.event === "task.deleted" && msg.task_id === id) {
@@ -77,7 +88,17 @@ export default function TaskDetailPage() {
             return;
         }
         if (msg.event === "task.updated") {
-            // A new task was created elsewhere; refresh the sidebar list
+            let updated: Task | null = null;
+            try {
+                updated = (typeof msg.task === "string" ? JSON.parse(msg.task) : msg.task) as Task;
+            } catch {
+            }
+            // Our own saves are applied from their responses, which may arrive after their events
+            if (updated?.id === id && pendingSaves.current === 0 && updated.version > (versionRef.current ?? 0)) {
+                applyTask(updated);
+                setRevision((r) => r + 1);
+            }
+            // The task may have been created or renamed elsewhere; refresh the sidebar list
             Tasks.list()
                 .then(setTasksList)
                 .catch(() => {
@@ -86,30 +107,46 @@ export default function TaskDetailPage() {
         }
     });
 
-    const onPatch = async (patch: Partial<Task>) => {
-        setSaving(true);
+    const reload = async () => {
         try {
-            const updated = await Tasks.update(id, patch);
-            setTask(updated);
-            toast.success("Saved");
-        } catch (e: any) {
-            toast.error(toErrorMessage(e, "Failed to save"));
-        } finally {
-            setSaving(false);
+            applyTask(await Tasks.get(id));
+            setRevision((r) => r + 1);
+        } catch {
+            toast.error("Failed to load task");
         }
     };
 
+    // Saves run one after another, each sending the version the previous one returned, so quick edits don't
+    // conflict with each other
+    const save = (patch: Partial<Task>, errorMessage: string, successMessage?: string) => {
+        pendingSaves.current += 1;
+        setSaving(true);
+        const run = saveQueue.current.then(async () => {
+            try {
+                // Sending the version we know makes the save fail, rather than overwrite, if someone else saved first
+                applyTask(await Tasks.update(id, {...patch, version: versionRef.current}));
+                if (successMessage) toast.success(successMessage);
+            } catch (e: any) {
+                if (e?.response?.status === 412) {
+                    toast.error("This task was changed elsewhere, showing its latest version");
+                    await reload();
+                } else {
+                    toast.error(toErrorMessage(e, errorMessage));
+                }
+            } finally {
+                pendingSaves.current -= 1;
+                if (pendingSaves.current === 0) setSaving(false);
+            }
+        });
+        saveQueue.current = run;
+        return run;
+    };
+
+    const onPatch = (patch: Partial<Task>) => save(patch, "Failed to save", "Saved");
+
     const toggleComplete = async () => {
         if (!task) return;
-        setSaving(true);
-        try {
-            const updated = await Tasks.update(id, {status: task.status === "Completed" ? "Pending" : "Completed"} as any);
-            setTask(updated);
-        } catch {
-            toast.error("Failed to toggle status");
-        } finally {
-            setSaving(false);
-        }
+        await save({status: task.status === "Completed" ? "Pending" : "Completed"}, "Failed to toggle status");
     };
 
     const onDelete = async () => {
@@ -127,8 +164,7 @@ export default function TaskDetailPage() {
 
     const unsubscribe = async (email: string) => {
         try {
-            const updated = await Tasks.unsubscribe(id, email);
-            setTask(updated);
+            applyTask(await Tasks.unsubscribe(id, email));
         } catch {
             toast.error("Failed to unsubscribe user");
         }
@@ -202,10 +238,10 @@ export default function TaskDetailPage() {
                 {/* Main content */}
                 <div className="lg:col-span-2 card min-w-0">
                     <div className="card-body min-w-0">
-                        <TaskForm initial={task} autosave onPatch={onPatch} submitting={saving} readOnly={readOnly}/>
+                        <TaskForm key={revision} initial={task} autosave onPatch={onPatch} submitting={saving} readOnly={readOnly}/>
                         <div className="mt-6">
                             <div className="card-title mb-2">Readers</div>
-                            {readOnly ? null : <AddReaderBar id={id} setTask={setTask}/>}
+                            {readOnly ? null : <AddReaderBar id={id} setTask={applyTask}/>}
                             <div className="mt-3 flex flex-wrap gap-2">
                                 {task.reader_emails.length === 0 && (
                                     <p className="text-sm text-muted-foreground">No readers</p>
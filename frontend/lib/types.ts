@@ -18,6 +18,7 @@ export interface Task extends Omit<TaskSummary, "owner_name" | "owner_email"> {
     description: string;
     created_at: string;
     updated_at: string;
+    version: number;
     owner_name: string;
     owner_email: string;
     reader_emails: string[];
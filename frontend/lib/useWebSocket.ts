@@ -4,7 +4,7 @@ import {WS_BASE} from "@/lib/config";
 import {useAuth} from "@/lib/store";
 
 export interface TaskWsUpdate {
-    event: "task.updated" | "task.deleted";
+    event: "task.updated" | "task.deleted" | "ping";
     task?: string | object;
     task_id?: string;
 }
@@ -12,6 +12,9 @@ export interface TaskWsUpdate {
 export function useTaskWebSocket(onMessage: (msg: TaskWsUpdate) => void) {
     const token = useAuth((s) => s.accessToken);
     const wsRef = useRef<WebSocket | null>(null);
+    // Handlers usually change on each render, which mustn't reconnect the socket and miss events meanwhile
+    const onMessageRef = useRef(onMessage);
+    onMessageRef.current = onMessage;
 
     useEffect(() => {
         if (!token) return;
@@ -22,7 +25,12 @@ export function useTaskWebSocket(onMessage: (msg: TaskWsUpdate) => void) {
         ws.onmessage = (e) => {
             try {
                 const data = JSON.parse(e.data);
-                onMessage(data as TaskWsUpdate);
+                if (data.event === "ping") {
+                    // The server disconnects clients which stop answering pings
+                    ws.send(JSON.stringify({event: "pong"}));
+                    return;
+                }
+                onMessageRef.current(data as TaskWsUpdate);
             } catch {
             }
         };
@@ -34,5 +42,5 @@ export function useTaskWebSocket(onMessage: (msg: TaskWsUpdate) => void) {
         return () => {
             ws.close();
         };
-    }, [token, onMessage]);
+    }, [token]);
 }